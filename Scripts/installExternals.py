@@ -25,26 +25,42 @@
 
 from __future__ import print_function
 import argparse
-import codecs
+import concurrent.futures
 import contextlib
+import copy
 import datetime
 import fnmatch
+import functools
 import glob
+import hashlib
+import http.client
+import inspect
+import io
 import locale
-import multiprocessing
+import mmap
 import os
 import platform
+import random
 import re
 import shlex
 import shutil
 import subprocess
 import sys
-import sysconfig
 import tarfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
 import zipfile
 
 from urllib.request import urlopen
-from shutil import which
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 if sys.version_info.major < 3:
     raise Exception("Python 3 or a more recent version is required.")
@@ -52,50 +68,70 @@ if sys.version_info.major < 3:
 # Helpers for printing output
 verbosity = 1
 
+# Dependencies are installed on several threads, so each message is written
+# in a single call under a lock, to keep the messages of different threads
+# from being interleaved.
+outputLock = threading.Lock()
+
+def WriteOutput(text):
+    with outputLock:
+        sys.stdout.write(text)
+
 def Print(msg):
     if verbosity > 0:
-        print(msg)
+        WriteOutput("{}\n".format(msg))
 
 def PrintWarning(warning):
     if verbosity > 0:
-        print("WARNING:", warning)
+        WriteOutput("WARNING: {}\n".format(warning))
 
 def PrintStatus(status):
     if verbosity >= 1:
-        print("STATUS:", status)
+        WriteOutput("STATUS: {}\n".format(status))
 
 def PrintInfo(info):
     if verbosity >= 2:
-        print("INFO:", info)
+        WriteOutput("INFO: {}\n".format(info))
 
 def PrintCommandOutput(output):
     if verbosity >= 3:
-        sys.stdout.write(output)
+        WriteOutput(output)
 
 def PrintError(error):
     if verbosity >= 3 and sys.exc_info()[1] is not None:
         import traceback
         traceback.print_exc()
-    print ("ERROR:", error)
+    WriteOutput("ERROR: {}\n".format(error))
 
-# Helpers for determining platform
+# Helpers for determining platform. platform.system() is evaluated once since
+# these are checked all over the script.
+PLATFORM_SYSTEM = platform.system()
 def Windows():
-    return platform.system() == "Windows"
+    return PLATFORM_SYSTEM == "Windows"
 def Linux():
-    return platform.system() == "Linux"
+    return PLATFORM_SYSTEM == "Linux"
 
+@functools.lru_cache(maxsize=None)
+def which(cmd):
+    """
+    Like shutil.which, but the result is cached since the same tools are
+    looked up several times.
+    """
+    return shutil.which(cmd)
+
+@functools.lru_cache(maxsize=None)
 def GetLocale():
     return sys.stdout.encoding or locale.getdefaultlocale()[1] or "UTF-8"
 
 def GetCommandOutput(command):
     """Executes the specified command and returns output or None."""
-    try:
-        return subprocess.check_output(shlex.split(command),
-            stderr=subprocess.STDOUT).decode(GetLocale(), 'replace').strip()
-    except subprocess.CalledProcessError:
-        pass
-    return None
+    result = subprocess.run(shlex.split(command), stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT)
+    if result.returncode != 0:
+        return None
+    return result.stdout.decode(GetLocale(), 'replace').strip()
 
+@functools.lru_cache(maxsize=None)
 def GetVisualStudioCompilerAndVersion():
     """
     Returns a tuple containing the path to the Visual Studio compiler
@@ -115,6 +151,7 @@ def GetVisualStudioCompilerAndVersion():
             return (msvcCompiler, tuple(int(v) for v in match.groups()))
     return None
 
+@functools.lru_cache(maxsize=None)
 def IsVisualStudioVersionOrGreater(desiredVersion):
     if not Windows():
         return False
@@ -129,88 +166,325 @@ def IsVisualStudio2019OrGreater():
     VISUAL_STUDIO_2019_VERSION = (16, 0)
     return IsVisualStudioVersionOrGreater(VISUAL_STUDIO_2019_VERSION)
 
-def GetCPUCount():
+def IsVisualStudio2022OrGreater():
+    VISUAL_STUDIO_2022_VERSION = (17, 0)
+    return IsVisualStudioVersionOrGreater(VISUAL_STUDIO_2022_VERSION)
+
+@functools.lru_cache(maxsize=None)
+def GetCompilerId():
+    """
+    Returns a string identifying the C++ compiler used by default to build the
+    dependencies.
+    """
+    if Windows():
+        return repr(GetVisualStudioCompilerAndVersion())
     try:
-        return multiprocessing.cpu_count()
-    except NotImplementedError:
-        return 1
+        output = GetCommandOutput("{cxx} --version".format(
+            cxx=os.environ.get("CXX", "c++")))
+    except OSError:
+        output = None
+    return (output or "").split("\n")[0]
+
+@functools.lru_cache(maxsize=None)
+def GetCPUCount():
+    return os.cpu_count() or 1
 
-def Run(cmd, logCommandOutput = True):
+def GetDefaultJobCount():
+    """
+    Returns the number of build jobs given by the AURORA_BUILD_JOBS
+    environment variable, or the number of processors.
     """
-    Run the specified command in a subprocess.
+    jobs = os.environ.get("AURORA_BUILD_JOBS", "")
+    return int(jobs) if jobs.isdigit() and int(jobs) > 0 else GetCPUCount()
+
+@functools.lru_cache(maxsize=None)
+def GetPhysicalCPUCount():
     """
+    Returns the number of physical cores, or the number of logical processors
+    if it can't be determined.
+    """
+    if Linux():
+        try:
+            cores = set()
+            physicalId = None
+            with open("/proc/cpuinfo", "r") as f:
+                for line in f:
+                    key, _, value = line.partition(":")
+                    key = key.strip()
+                    if key == "physical id":
+                        physicalId = value.strip()
+                    elif key == "core id":
+                        cores.add((physicalId, value.strip()))
+            if cores:
+                return len(cores)
+        except OSError:
+            pass
+    elif PLATFORM_SYSTEM == "Darwin":
+        output = GetCommandOutput("sysctl -n hw.physicalcpu")
+        if output and output.isdigit():
+            return int(output)
+    return GetCPUCount()
+
+def Run(cmd, logCommandOutput = True, cwd = None):
+    """
+    Run the specified command in a subprocess. The command is either a
+    string, split into arguments like a shell would, or a list of arguments,
+    used as is without any quoting. No shell is involved in either case.
+    The command is run in cwd, or in the current working directory of the
+    calling thread if cwd is None.
+    """
+    if isinstance(cmd, str):
+        argv = shlex.split(cmd)
+    else:
+        argv = [str(arg) for arg in cmd]
+        cmd = shlex.join(argv)
+
     PrintInfo('Running "{cmd}"'.format(cmd=cmd))
 
-    with codecs.open("log.txt", "a", "utf-8") as logfile:
-        logfile.write(datetime.datetime.now().strftime("%Y-%m-%d %H:%M"))
-        logfile.write("\n")
-        logfile.write(cmd)
-        logfile.write("\n")
+    if cwd is None:
+        cwd = GetCurrentWorkingDirectory()
+    logFilename = os.path.join(cwd, "log.txt")
 
+    # Collect the raw command output in memory and append it to the log file
+    # with a single write once the command has completed.
+    log = io.BytesIO()
+    log.write("{time}\n{cmd}\n".format(
+        time=datetime.datetime.now().strftime("%Y-%m-%d %H:%M"),
+        cmd=cmd).encode("utf-8"))
+
+    try:
         # Let exceptions escape from subprocess calls -- higher level
         # code will handle them.
         if logCommandOutput:
-            p = subprocess.Popen(shlex.split(cmd), stdout=subprocess.PIPE,
-                                 stderr=subprocess.STDOUT)
-            while True:
-                l = p.stdout.readline().decode(GetLocale(), 'replace')
-                if l:
-                    logfile.write(l)
-                    PrintCommandOutput(l)
-                elif p.poll() is not None:
-                    break
+            p = subprocess.Popen(argv, stdout=subprocess.PIPE,
+                                 stderr=subprocess.STDOUT, cwd=cwd)
+            # The output is logged as raw bytes, and only decoded when it's
+            # printed.
+            for l in iter(p.stdout.readline, b''):
+                log.write(l)
+                if verbosity >= 3:
+                    PrintCommandOutput(l.decode(GetLocale(), 'replace'))
+            p.wait()
         else:
-            p = subprocess.Popen(shlex.split(cmd))
+            p = subprocess.Popen(argv, cwd=cwd)
             p.wait()
+    finally:
+        with open(logFilename, "ab") as logfile:
+            logfile.write(log.getvalue())
 
     if p.returncode != 0:
         # If verbosity >= 3, we'll have already been printing out command output
-        # so no reason to print the log file again.
+        # so no reason to print it again. Only the output of this command is
+        # printed, rather than the whole log file.
         if verbosity < 3:
-            with open("log.txt", "r") as logfile:
-                Print(logfile.read())
+            Print(log.getvalue().decode(GetLocale(), 'replace'))
         raise RuntimeError("Failed to run '{cmd}'\nSee {log} for more details."
-                           .format(cmd=cmd, log=os.path.abspath("log.txt")))
+                           .format(cmd=cmd, log=logFilename))
+
+# Dependencies may be installed on several threads at once, so the current
+# working directory is tracked per thread instead of changing the working
+# directory of the process. Relative paths are resolved with AbsPath, and
+# commands are run in the thread's working directory.
+threadState = threading.local()
+
+def GetCurrentWorkingDirectory():
+    """
+    Returns the current working directory of the calling thread.
+    """
+    return getattr(threadState, "cwd", None) or os.getcwd()
+
+def AbsPath(path):
+    """
+    Like os.path.abspath, but relative paths are relative to the current
+    working directory of the calling thread.
+    """
+    return os.path.normpath(os.path.join(GetCurrentWorkingDirectory(), path))
 
 @contextlib.contextmanager
 def CurrentWorkingDirectory(dir):
     """
-    Context manager that sets the current working directory to the given
-    directory and resets it to the original directory when closed.
+    Context manager that sets the current working directory of the calling
+    thread to the given directory and resets it to the original directory
+    when closed.
     """
-    curdir = os.getcwd()
-    os.chdir(dir)
+    newdir = AbsPath(dir)
+    if not os.path.isdir(newdir):
+        raise FileNotFoundError("Directory {dir} not found".format(dir=newdir))
+    curdir = getattr(threadState, "cwd", None)
+    threadState.cwd = newdir
     try: yield
-    finally: os.chdir(curdir)
+    finally: threadState.cwd = curdir
+
+def RecordInstalledFile(path):
+    """
+    Records that the given file was installed by the dependency being
+    installed on the calling thread, if its installed files are recorded to be
+    stored in the build cache.
+    """
+    installedFiles = getattr(threadState, "installedFiles", None)
+    if installedFiles is not None:
+        installedFiles.add(os.path.abspath(path))
 
 def CopyFiles(context, src, dest, destPrefix):
     """
     Copy files like shutil.copy, but src may be a glob pattern.
     """
-    filesToCopy = glob.glob(src)
+    srcDir, pattern = os.path.split(AbsPath(src))
+    if glob.has_magic(srcDir):
+        filesToCopy = glob.glob(os.path.join(srcDir, pattern))
+    else:
+        # Only the file name is a pattern, so a single directory listing is
+        # enough to find the files to copy.
+        try:
+            with os.scandir(srcDir) as entries:
+                filesToCopy = [os.path.join(srcDir, e.name) for e in entries
+                               if e.is_file() and fnmatch.fnmatch(e.name, pattern)]
+        except FileNotFoundError:
+            filesToCopy = []
     if not filesToCopy:
         raise RuntimeError("File(s) to copy {src} not found".format(src=src))
 
-    instDestDir = os.path.join(context.externalsInstDir, destPrefix, dest)
-    if not os.path.isdir(instDestDir):
-        os.makedirs(instDestDir)
+    instDestDir = os.path.join(context.configInstDirs[destPrefix], dest)
+    os.makedirs(instDestDir, exist_ok=True)
 
     for f in filesToCopy:
         PrintCommandOutput("Copying {file} to {destDir}\n"
                            .format(file=f, destDir=instDestDir))
-        shutil.copy(f, instDestDir)
+        CloneOrCopyFile(f, os.path.join(instDestDir, os.path.basename(f)))
+        RecordInstalledFile(os.path.join(instDestDir, os.path.basename(f)))
+
+# ioctl request cloning a file on Linux file systems that support it.
+FICLONE = 0x40049409
 
-def CopyDirectory(context, srcDir, destDir, destPrefix):
+def CloneOrCopyFile(src, dst):
     """
-    Copy directory like shutil.copytree.
+    Copy src to dst like shutil.copy. On Linux, the file is cloned instead if
+    the file system supports it (e.g. btrfs, XFS), so that the data is shared
+    copy-on-write rather than copied.
+
+    An existing dst is removed first rather than overwritten, since it may be
+    a hard link to src (or to another file) installed by LinkOrCopyFile.
+    """
+    if os.path.normcase(os.path.abspath(src)) == os.path.normcase(os.path.abspath(dst)):
+        raise shutil.SameFileError("{src} and {dst} are the same file"
+                                   .format(src=src, dst=dst))
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if fcntl is not None and Linux():
+        try:
+            with open(src, "rb") as srcFile, open(dst, "wb") as dstFile:
+                fcntl.ioctl(dstFile.fileno(), FICLONE, srcFile.fileno())
+            shutil.copymode(src, dst)
+            return dst
+        except OSError:
+            pass
+    return shutil.copy(src, dst)
+
+def LinkOrCopyFile(src, dst):
+    """
+    Create a hard link dst to src, or copy src to dst like shutil.copy if
+    hard links are not supported (e.g. across file systems).
     """
-    instDestDir = os.path.join(context.externalsInstDir, destPrefix, destDir)
-    if os.path.isdir(instDestDir):
-        shutil.rmtree(instDestDir)
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        CloneOrCopyFile(src, dst)
+    return dst
 
-    PrintCommandOutput("Copying {srcDir} to {destDir}\n"
-                       .format(srcDir=srcDir, destDir=instDestDir))
-    shutil.copytree(srcDir, instDestDir)
+def GetTrashDirectory(context):
+    return os.path.join(context.buildDir, ".trash")
+
+def RemoveDirectory(context, path):
+    """
+    Removes the given directory like shutil.rmtree, but in the background:
+    the directory is moved to the trash directory in the build directory
+    first, so that the path can be reused right away, then deleted on another
+    thread. The script waits for the deletion to complete before exiting.
+    The directory is removed in the foreground if it can't be moved, e.g.
+    if it is on another file system.
+    """
+    trashPath = os.path.join(GetTrashDirectory(context), uuid.uuid4().hex)
+    try:
+        os.makedirs(GetTrashDirectory(context), exist_ok=True)
+        os.rename(path, trashPath)
+    except OSError:
+        shutil.rmtree(path)
+        return
+    threading.Thread(target=shutil.rmtree, args=(trashPath,),
+                     kwargs=dict(ignore_errors=True)).start()
+
+def EmptyTrash(context):
+    """
+    Deletes the directories left in the trash directory by a previous run
+    that was interrupted, in the background.
+    """
+    try:
+        trashPaths = [e.path for e in os.scandir(GetTrashDirectory(context))]
+    except OSError:
+        return
+
+    def DeleteAll():
+        for path in trashPaths:
+            shutil.rmtree(path, ignore_errors=True)
+    threading.Thread(target=DeleteAll).start()
+
+# Maximum number of threads copying the files of a directory, and minimum
+# number of files copied by each thread.
+COPY_WORKERS = max(1, min(8, GetCPUCount()))
+COPY_FILES_PER_WORKER = 32
+
+def CopyDirectory(context, srcDir, destDir, destPrefix, force=False, link=False):
+    """
+    Copy directory like shutil.copytree. Files are copied into an existing
+    destination directory, unless force is set, in which case the destination
+    directory is removed first.
+
+    If link is set, files are hard linked instead of copied when possible. This
+    is meant for files that are installed unchanged for each configuration,
+    such as headers and shaders.
+    """
+    instDestDir = os.path.join(context.configInstDirs[destPrefix], destDir)
+    if force and os.path.isdir(instDestDir):
+        RemoveDirectory(context, instDestDir)
+
+    PrintCommandOutput("{action} {srcDir} to {destDir}\n"
+                       .format(action=("Linking" if link else "Copying"),
+                               srcDir=srcDir, destDir=instDestDir))
+    # Walk the source directory once, creating the destination directories
+    # on the way, then copy the files on several threads, since most of the
+    # time is spent in per-file system calls. File times and other metadata
+    # don't need to be preserved, only the permissions (e.g. for executables).
+    srcDir = AbsPath(srcDir)
+    filesToCopy = []
+    for root, dirs, files in os.walk(srcDir, followlinks=True):
+        destRoot = os.path.normpath(os.path.join(instDestDir, os.path.relpath(root, srcDir)))
+        os.makedirs(destRoot, exist_ok=True)
+        for f in files:
+            filesToCopy.append((os.path.join(root, f), os.path.join(destRoot, f)))
+            RecordInstalledFile(os.path.join(destRoot, f))
+
+    copyFunction = LinkOrCopyFile if link else CloneOrCopyFile
+    numWorkers = min(COPY_WORKERS, max(1, len(filesToCopy) // COPY_FILES_PER_WORKER))
+    if numWorkers == 1:
+        for src, dst in filesToCopy:
+            copyFunction(src, dst)
+        return
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=numWorkers) as executor:
+        for future in [executor.submit(copyFunction, src, dst)
+                       for src, dst in filesToCopy]:
+            future.result()
+
+def GetUnityBuildArgs(context):
+    """
+    Returns the CMake arguments to compile the sources of a library in
+    batches (unity build), if enabled with --unity-build.
+    """
+    if not context.unityBuild:
+        return []
+    return ['-DCMAKE_UNITY_BUILD=ON', '-DCMAKE_UNITY_BUILD_BATCH_SIZE=16']
 
 def FormatMultiProcs(numJobs, generator):
     tag = "-j"
@@ -220,6 +494,49 @@ def FormatMultiProcs(numJobs, generator):
 
     return "{tag}{procs}".format(tag=tag, procs=numJobs)
 
+def IsMakefileGenerator(generator):
+    """
+    Returns True if the given CMake generator arguments select a Makefile
+    generator, which is the CMake default on Linux and macOS.
+    """
+    if generator is None:
+        return not Windows() and not os.environ.get("CMAKE_GENERATOR")
+    return "Makefiles" in generator
+
+class BuildJobPool(object):
+    """
+    Pool of the build jobs shared by the builds of all the dependencies, so
+    that the builds running at the same time never run more than numJobs
+    jobs in total, while a build running alone gets all of them.
+    """
+    def __init__(self, numJobs):
+        self.numJobs = numJobs
+        self.availableJobs = numJobs
+        self.numBuilds = 0
+        self.condition = threading.Condition()
+
+    @contextlib.contextmanager
+    def Acquire(self, maxJobs=None):
+        """
+        Takes the jobs of a build for the duration of the context, which
+        returns the number of jobs taken: the jobs divided by the number of
+        builds running or waiting for jobs, up to maxJobs, or fewer if the
+        other builds hold them. Waits for at least one job to be available.
+        """
+        with self.condition:
+            self.numBuilds += 1
+            self.condition.wait_for(lambda: self.availableJobs > 0)
+            numJobs = min(self.availableJobs, max(1, self.numJobs // self.numBuilds),
+                          maxJobs or self.numJobs)
+            self.availableJobs -= numJobs
+        try:
+            yield numJobs
+        finally:
+            with self.condition:
+                self.availableJobs += numJobs
+                self.numBuilds -= 1
+                self.condition.notify_all()
+
 def BuildConfigs(context):
     configs = []
     if context.buildDebug:
@@ -230,6 +547,10 @@ def BuildConfigs(context):
         configs.append("RelWithDebInfo")
     return configs
 
+# Maximum number of link jobs run at the same time by the Ninja builds. Links
+# of large shared libraries (e.g. USD) use much more memory than compiles.
+MAX_LINK_JOBS = 2
+
 def RunCMake(context, force, extraArgs = None,  configExtraArgs = None, install = True):
     """
     Invoke CMake to configure, build, and install a library whose
@@ -237,7 +558,7 @@ def RunCMake(context, force, extraArgs = None,  configExtraArgs = None, install
     """
     # Create a directory for out-of-source builds in the build directory
     # using the name of the current working directory.
-    srcDir = os.getcwd()
+    srcDir = GetCurrentWorkingDirectory()
     generator = context.cmakeGenerator
 
     if generator is not None:
@@ -249,43 +570,119 @@ def RunCMake(context, force, extraArgs = None,  configExtraArgs = None, install
     if toolset is not None:
         toolset = '-T "{toolset}"'.format(toolset=toolset)
 
-
-    for config in BuildConfigs(context):
-        buildDir = os.path.join(context.buildDir, os.path.split(srcDir)[1], config)
+    # Ninja runs the link jobs from the same pool as the compile jobs, so
+    # limit them with a separate job pool.
+    jobPools = None
+    if context.cmakeGenerator and "Ninja" in context.cmakeGenerator:
+        jobPools = ('-DCMAKE_JOB_POOLS="link={jobs}" -DCMAKE_JOB_POOL_LINK=link'
+                    .format(jobs=MAX_LINK_JOBS))
+
+    # Compile through ccache or sccache if available, so that rebuilding a
+    # library doesn't recompile sources that haven't changed. Only the Ninja
+    # and Makefile generators support compiler launchers, the Visual Studio
+    # generators ignore them.
+    launcher = context.compilerLauncher
+    if not (IsMakefileGenerator(generator) or (generator and "Ninja" in generator)):
+        launcher = None
+    if launcher is not None:
+        launcher = ('-DCMAKE_C_COMPILER_LAUNCHER="{launcher}" '
+                    '-DCMAKE_CXX_COMPILER_LAUNCHER="{launcher}"'
+                    .format(launcher=launcher))
+        if Windows():
+            # The compiler caches need the debug information to be embedded
+            # in the object files (/Z7) with MSVC.
+            launcher += (' -DCMAKE_POLICY_DEFAULT_CMP0141=NEW'
+                         ' -DCMAKE_MSVC_DEBUG_INFORMATION_FORMAT=Embedded')
+
+    # Each configuration has its own build and install directories, so all of
+    # them are configured at the same time, as the configure step is mostly
+    # single threaded. The configure steps don't take any build jobs, so they
+    # also overlap with the builds of the other dependencies. The builds are
+    # then run one after the other, each of them with the jobs it takes from
+    # the shared pool, to avoid oversubscribing the machine.
+    configs = context.buildConfigs
+    buildRoot = os.path.join(context.buildDir, os.path.basename(srcDir))
+
+    def GetBuildDir(config):
+        return os.path.join(buildRoot, config)
+
+    # Arguments shared by all the configurations.
+    commonArgs = ('{generator} '
+        '{toolset} '
+        '{launcher} '
+        '{jobPools} '
+        '{extraArgs} '
+        .format(generator=(generator or ""),
+                toolset=(toolset or ""),
+                launcher=(launcher or ""),
+                jobPools=(jobPools or ""),
+                extraArgs=(" ".join(extraArgs) if extraArgs else "")))
+
+    def ConfigureConfig(config):
+        buildDir = GetBuildDir(config)
         if force and os.path.isdir(buildDir):
-            shutil.rmtree(buildDir)
-        if not os.path.isdir(buildDir):
-            os.makedirs(buildDir)
-
-        instDir = os.path.join(context.externalsInstDir, config)
-
-        with CurrentWorkingDirectory(buildDir):
-            # We use -DCMAKE_BUILD_TYPE for single-configuration generators
-            # (Ninja, make), and --config for multi-configuration generators
-            # (Visual Studio); technically we don't need BOTH at the same
-            # time, but specifying both is simpler than branching
-            Run('cmake '
-                '-DCMAKE_INSTALL_PREFIX="{instDir}" '
-                '-DCMAKE_PREFIX_PATH="{instDir}" '
-                '-DCMAKE_BUILD_TYPE={config} '
-                '{generator} '
-                '{toolset} '
-                '{extraArgs} '
-                '{configExtraArgs} '
-                '"{srcDir}"'
-                .format(instDir=instDir,
-                        config=config,
-                        srcDir=srcDir,
-                        generator=(generator or ""),
-                        toolset=(toolset or ""),
-                        extraArgs=(" ".join(extraArgs) if extraArgs else ""),
-                        configExtraArgs=(configExtraArgs[config] if configExtraArgs else "")))
-
-            Run("cmake --build . --config {config} {install} -- {multiproc}"
-                .format(config=config,
-                        install=("--target install" if install else ""),
-                        multiproc=FormatMultiProcs(context.numJobs, generator)))
-
+            RemoveDirectory(context, buildDir)
+        os.makedirs(buildDir, exist_ok=True)
+
+        instDir = context.configInstDirs[config]
+
+        # We use -DCMAKE_BUILD_TYPE for single-configuration generators
+        # (Ninja, make), and --config for multi-configuration generators
+        # (Visual Studio); technically we don't need BOTH at the same
+        # time, but specifying both is simpler than branching
+        configureCmd = ('cmake '
+            '-DCMAKE_INSTALL_PREFIX="{instDir}" '
+            '-DCMAKE_PREFIX_PATH="{instDir}" '
+            '-DCMAKE_BUILD_TYPE={config} '
+            '{commonArgs}'
+            '{configExtraArgs} '
+            '"{srcDir}"'
+            .format(instDir=instDir,
+                    config=config,
+                    srcDir=srcDir,
+                    commonArgs=commonArgs,
+                    configExtraArgs=(configExtraArgs[config] if configExtraArgs else "")))
+
+        # Skip the configure step if the build directory was already
+        # configured with exactly the same command.
+        configHash = hashlib.sha1(configureCmd.encode("utf-8")).hexdigest()
+        configHashFilename = os.path.join(buildDir, "AuroraConfigHash.txt")
+        try:
+            with open(configHashFilename, "r") as f:
+                configured = (f.read().strip() == configHash and
+                              os.path.isfile(os.path.join(buildDir, "CMakeCache.txt")))
+        except OSError:
+            configured = False
+
+        if configured:
+            PrintInfo("{buildDir} is already configured, skipping CMake configure"
+                      .format(buildDir=buildDir))
+        else:
+            Run(configureCmd, cwd=buildDir)
+            with open(configHashFilename, "w") as f:
+                f.write(configHash)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(configs))) as executor:
+        for future in [executor.submit(ConfigureConfig, config) for config in configs]:
+            future.result()
+
+    # Installing with cmake --install rather than building the install target
+    # avoids checking the whole build again, and only copies the files that
+    # are not up to date in the install directory.
+    for config in configs:
+        with context.buildJobPool.Acquire() as numJobs:
+            Run("cmake --build . --config {config} -- {multiproc}"
+                .format(config=config, multiproc=FormatMultiProcs(numJobs, generator)),
+                cwd=GetBuildDir(config))
+        if install:
+            Run("cmake --install . --config {config}".format(config=config),
+                cwd=GetBuildDir(config))
+            with open(os.path.join(GetBuildDir(config), "install_manifest.txt"), "r") as f:
+                for line in f:
+                    if line.strip():
+                        RecordInstalledFile(line.strip())
+
+@functools.lru_cache(maxsize=None)
 def GetCMakeVersion():
     """
     Returns the CMake version as tuple of integers (major, minor) or
@@ -314,48 +711,431 @@ def PatchFile(filename, patches, multiLineMatches=False):
     """
     Applies patches to the specified file. patches is a list of tuples
     (old string, new string).
+
+    If multiLineMatches is set, old strings may span multiple lines. In that
+    case all patches are applied in a single pass over a read-only memory map
+    of the file, so each old string is matched against the original contents.
     """
+    filename = AbsPath(filename)
     if multiLineMatches:
-        oldLines = [open(filename, 'r').read()]
-    else:
-        oldLines = open(filename, 'r').readlines()
-    newLines = oldLines
+        PatchFileMultiLine(filename, patches)
+        return
+
+    # Old strings don't contain line breaks, so they can be replaced in the
+    # raw contents of the whole file rather than line by line.
+    with open(filename, 'rb') as f:
+        oldData = f.read()
+    newData = oldData
     for (oldString, newString) in patches:
-        newLines = [s.replace(oldString, newString) for s in newLines]
-    if newLines != oldLines:
+        newData = newData.replace(oldString.encode(), newString.encode())
+    if newData != oldData:
         PrintInfo("Patching file {filename} (original in {oldFilename})..."
                   .format(filename=filename, oldFilename=filename + ".old"))
-        shutil.copy(filename, filename + ".old")
-        open(filename, 'w').writelines(newLines)
+        # Move the original aside instead of copying it, then write the
+        # patched contents to a new file.
+        os.replace(filename, filename + ".old")
+        with open(filename, 'wb') as f:
+            f.write(newData)
+
+def PatchFileMultiLine(filename, patches):
+    if not patches or os.path.getsize(filename) == 0:
+        return
+
+    # Match line breaks in old strings regardless of the file's line endings,
+    # and put each old string in its own group so that the replacement can be
+    # looked up from the index of the group that matched.
+    newStrings = [newString.encode().replace(b"\r\n", b"\n") for (_, newString) in patches]
+    pattern = re.compile(b"|".join(
+        b"(" + rb"\r?\n".join(re.escape(l) for l in oldString.encode().split(b"\n")) + b")"
+        for (oldString, _) in patches))
+
+    with open(filename, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if not pattern.search(mm):
+                return
+
+            # Write the replacement with the line ending that was matched, or
+            # with the file's first line ending if the old string is a single
+            # line, so that CRLF files don't end up with mixed line endings.
+            firstNewline = mm.find(b"\n")
+            fileCRLF = firstNewline > 0 and mm[firstNewline - 1:firstNewline] == b"\r"
+
+            def Replace(m):
+                newString = newStrings[m.lastindex - 1]
+                matched = m.group(0)
+                crlf = b"\r\n" in matched if b"\n" in matched else fileCRLF
+                return newString.replace(b"\n", b"\r\n") if crlf else newString
+
+            newData = pattern.sub(Replace, mm)
+
+    PrintInfo("Patching file {filename} (original in {oldFilename})..."
+              .format(filename=filename, oldFilename=filename + ".old"))
+    os.replace(filename, filename + ".old")
+    with open(filename, 'wb') as f:
+        f.write(newData)
+
+def PreallocateFile(outfile, length):
+    """
+    Reserves length bytes on disk for the given open file, so that writing
+    it does not repeatedly grow the file. This is only an optimization, so
+    any errors are ignored.
+    """
+    try:
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(outfile.fileno(), 0, length)
+        elif Windows():
+            # Setting the end of file makes NTFS allocate the clusters up
+            # front. SetFileValidData is not used since it requires elevated
+            # privileges.
+            outfile.truncate(length)
+    except OSError:
+        pass
 
-def DownloadFileWithUrllib(url, outputFilename):
-    r = urlopen(url)
+def WriteResponseToFile(response, outputFilename):
     with open(outputFilename, "wb") as outfile:
-        outfile.write(r.read())
+        length = response.headers.get("Content-Length")
+        if length and length.isdigit():
+            PreallocateFile(outfile, int(length))
+        shutil.copyfileobj(response, outfile, 1024 * 1024)
+        # Drop any preallocated space that was not written.
+        outfile.truncate()
+
+        # A connection closed early ends the response without an error, so
+        # check that the whole file was received, to download it again
+        # rather than failing to extract a truncated archive.
+        if length and length.isdigit() and outfile.tell() != int(length):
+            raise RuntimeError("Incomplete download: received {received} of "
+                               "{length} bytes".format(received=outfile.tell(),
+                                                       length=length))
+
+# Large archives are downloaded in parts over several connections when the
+# server supports range requests, since servers and CI networks often limit
+# the bandwidth of each connection.
+DOWNLOAD_PARTS = 8
+DOWNLOAD_PARTS_MIN_SIZE = 16 * 1024 * 1024
+
+def GetDownloadLengthInParts(response):
+    """
+    Returns the length of the file in the given response if it should be
+    downloaded in parts, or None otherwise.
+    """
+    length = response.headers.get("Content-Length")
+    if (response.headers.get("Accept-Ranges") == "bytes" and
+        length and length.isdigit() and
+        int(length) >= DOWNLOAD_PARTS_MIN_SIZE):
+        return int(length)
+    return None
 
-def DownloadURL(url, context, force, extractDir = None, dontExtract = None, destDir = None):
+def DownloadFileInParts(url, outputFilename, length):
     """
-    Download and extract the archive file at given URL to the
-    source directory specified in the context.
+    Downloads the file at the given URL with DOWNLOAD_PARTS concurrent range
+    requests, each one writing its part of the file in place.
+    """
+    with open(outputFilename, "wb") as outfile:
+        PreallocateFile(outfile, length)
+        outfile.truncate(length)
+
+    partSize = (length + DOWNLOAD_PARTS - 1) // DOWNLOAD_PARTS
+
+    def DownloadPart(start):
+        end = min(start + partSize, length) - 1
+        request = urllib.request.Request(
+            url, headers={"Range": "bytes={0}-{1}".format(start, end)})
+        with urlopen(request) as r, open(outputFilename, "r+b") as outfile:
+            if r.status != 206:
+                raise RuntimeError("Server did not return a partial content "
+                                   "for range request")
+            outfile.seek(start)
+            shutil.copyfileobj(r, outfile, 1024 * 1024)
+            if outfile.tell() != end + 1:
+                raise RuntimeError("Incomplete download of {url}"
+                                   .format(url=url))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=DOWNLOAD_PARTS) as executor:
+        for future in [executor.submit(DownloadPart, start)
+                       for start in range(0, length, partSize)]:
+            future.result()
+
+# The downloaders return the ETag of the downloaded file, or None if unknown.
 
-    dontExtract may be a sequence of path prefixes that will
-    be excluded when extracting the archive.
+def DownloadFileWithUrllib(url, outputFilename):
+    with urlopen(url) as r:
+        etag = r.headers.get("ETag")
+        length = GetDownloadLengthInParts(r)
+        if not length:
+            WriteResponseToFile(r, outputFilename)
+            return etag
+        url = r.url
+    DownloadFileInParts(url, outputFilename, length)
+    return etag
+
+def DownloadFileWithAria2(url, outputFilename):
+    """
+    Downloads the file at the given URL with aria2c, over several connections.
+    """
+    outputDir, outputName = os.path.split(outputFilename)
+    Run('aria2c --max-connection-per-server=16 --split=16 '
+        '--file-allocation=none --allow-overwrite=true '
+        '--auto-file-renaming=false --dir="{dir}" --out="{out}" "{url}"'
+        .format(dir=outputDir, out=outputName, url=url),
+        cwd=outputDir)
+    return None
 
-    Returns the absolute path to the directory where files have
-    been extracted.
+def GetURLETag(url):
+    """
+    Returns the ETag of the file at the given URL, or None if unknown or if
+    the server can't be reached.
+    """
+    try:
+        with urlopen(urllib.request.Request(url, method="HEAD"), timeout=30) as r:
+            return r.headers.get("ETag")
+    except Exception:
+        return None
+
+# Open HTTP connections, per thread and keyed by (scheme, host), so that
+# downloads from the same host (most of them are from github.com) reuse the
+# connection and skip the TCP and TLS handshakes.
+httpConnections = threading.local()
+
+def GetHTTPConnection(scheme, host):
+    if not hasattr(httpConnections, "connections"):
+        httpConnections.connections = dict()
+
+    conn = httpConnections.connections.get((scheme, host))
+    if conn is None:
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(host)
+        elif scheme == "http":
+            conn = http.client.HTTPConnection(host)
+        else:
+            raise RuntimeError("Unsupported URL scheme {scheme}"
+                               .format(scheme=scheme))
+        httpConnections.connections[(scheme, host)] = conn
+    return conn
+
+def DownloadFileWithHTTPConnection(url, outputFilename):
+    """
+    Downloads the file at the given URL like DownloadFileWithUrllib, but
+    keeps the connection to the server open for subsequent downloads.
+    """
+    maxRedirects = 10
+    for i in range(maxRedirects + 1):
+        parts = urllib.parse.urlsplit(url)
+        conn = GetHTTPConnection(parts.scheme, parts.netloc)
+        try:
+            conn.request("GET",
+                         urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, "")),
+                         headers={"User-Agent": "Python-urllib/{0}.{1}".format(*sys.version_info)})
+            r = conn.getresponse()
+
+            # The response must be read completely before the connection can
+            # be used for the next request.
+            if r.status in (301, 302, 303, 307, 308):
+                r.read()
+                url = urllib.parse.urljoin(url, r.getheader("Location"))
+                continue
+            if r.status != 200:
+                r.read()
+                raise urllib.error.HTTPError(url, r.status, r.reason, r.headers, None)
+
+            etag = r.getheader("ETag")
+            length = GetDownloadLengthInParts(r)
+            if length:
+                # Large files are downloaded over several new connections.
+                conn.close()
+                DownloadFileInParts(url, outputFilename, length)
+                return etag
+
+            WriteResponseToFile(r, outputFilename)
+            return etag
+        except BaseException:
+            # The response may not have been read completely, e.g. when the
+            # download is interrupted, so close the connection to make the
+            # next request reconnect.
+            conn.close()
+            raise
+
+    raise RuntimeError("Too many redirects")
+
+# Maximum number of threads extracting a zip archive, and minimum number of
+# members extracted by each of them.
+ZIP_EXTRACT_WORKERS = max(1, min(8, GetCPUCount()))
+ZIP_MEMBERS_PER_WORKER = 64
+
+# Number of files of a tar archive written by each task, and maximum number of
+# tasks queued ahead of the threads writing them.
+TAR_FILES_PER_TASK = 64
+TAR_MAX_PENDING_TASKS = 16
+
+def ExtractTarArchive(archive, path, members = None):
+    """
+    Extracts the given members of the open tar archive, or all of its members
+    if None, to path. The archive is read and decompressed in order on the
+    calling thread, while its files are written in batches by other threads,
+    since most of the time is spent creating the files of large source
+    archives (e.g. boost). Members with absolute paths or outside of path are
+    rejected.
+    """
+    def WriteFiles(files):
+        for filename, data, mode, mtime in files:
+            with open(filename, "wb") as f:
+                f.write(data)
+            if mode is not None:
+                os.chmod(filename, mode)
+            os.utime(filename, (mtime, mtime))
+
+    def WaitForTasks(pending, maxPending):
+        while len(pending) > maxPending:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                future.result()
+        return pending
+
+    createdDirs = set()
+    pending = set()
+    files = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=ZIP_EXTRACT_WORKERS) as executor:
+        def SubmitFiles(pending, files):
+            if files:
+                pending = WaitForTasks(pending, TAR_MAX_PENDING_TASKS - 1)
+                pending.add(executor.submit(WriteFiles, files))
+            return pending
+
+        for member in (archive if members is None else members):
+            member = tarfile.tar_filter(member, path)
+            targetPath = os.path.join(path, member.name)
+            if member.isdir():
+                # Directories are only created, so that their permissions
+                # don't prevent writing the files they contain.
+                os.makedirs(targetPath, exist_ok=True)
+                createdDirs.add(targetPath)
+            elif member.isreg():
+                dirname = os.path.dirname(targetPath)
+                if dirname not in createdDirs:
+                    os.makedirs(dirname, exist_ok=True)
+                    createdDirs.add(dirname)
+                files.append((targetPath, archive.extractfile(member).read(),
+                              member.mode, member.mtime))
+                if len(files) == TAR_FILES_PER_TASK:
+                    pending = SubmitFiles(pending, files)
+                    files = []
+            else:
+                # Hard links need their target to be written first.
+                if member.islnk():
+                    pending = WaitForTasks(SubmitFiles(pending, files), 0)
+                    files = []
+                archive.extract(member, path, filter="tar")
+        WaitForTasks(SubmitFiles(pending, files), 0)
+
+def ExtractArchive(archive, filename, path, members = None):
+    """
+    Extracts the given members of the open archive read from filename, or all
+    of its members if None, to path.
+
+    Zip archives are extracted by several threads, each one reading the
+    archive with its own handle, since decompressing releases the GIL.
+    """
+    if isinstance(archive, tarfile.TarFile):
+        if not hasattr(tarfile, "tar_filter"):
+            archive.extractall(path, members=members)
+        elif ZIP_EXTRACT_WORKERS == 1:
+            # Reject members with absolute paths or outside of path.
+            archive.extractall(path, members=members, filter="tar")
+        else:
+            ExtractTarArchive(archive, path, members)
+        return
+
+    members = list(archive.infolist() if members is None else members)
+
+    # Create the directories up front, so that the threads don't race to
+    # create the same parent directories.
+    dirs = set()
+    for m in members:
+        parts = [p for p in m.filename.split("/")[:-1] if p not in ("", ".", "..")]
+        dirs.add(os.path.join(path, *parts))
+    for d in sorted(dirs):
+        os.makedirs(d, exist_ok=True)
+
+    def ExtractMembers(chunk):
+        with zipfile.ZipFile(filename) as zf:
+            for m in chunk:
+                zf.extract(m, path)
+
+    # Small archives are not worth the threads. Otherwise the members are
+    # dealt from the largest to the smallest, to balance the work.
+    numWorkers = min(ZIP_EXTRACT_WORKERS,
+                     max(1, len(members) // ZIP_MEMBERS_PER_WORKER))
+    if numWorkers == 1:
+        ExtractMembers(members)
+        return
+
+    members.sort(key=lambda m: m.file_size, reverse=True)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=numWorkers) as executor:
+        for future in [executor.submit(ExtractMembers, members[i::numWorkers])
+                       for i in range(numWorkers)]:
+            future.result()
+
+def GetDownloadCachePath(context, url):
+    """
+    Returns the path of the archive for the given URL in the download cache,
+    or None if the download cache is disabled.
+    """
+    if not context.downloadCacheDir:
+        return None
+    urlHash = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(context.downloadCacheDir,
+                        urlHash + "_" + url.split("/")[-1])
+
+# Delay in seconds before retrying a failed download, doubled after each
+# failure. A random factor is applied to it, so that downloads running at the
+# same time don't all retry against the same server at once.
+DOWNLOAD_RETRY_BACKOFF = 0.5
+
+def DownloadArchive(url, context, force):
+    """
+    Download the archive file at given URL to the source directory specified
+    in the context, unless it was already downloaded.
+
+    Returns the absolute path to the downloaded archive.
     """
     with CurrentWorkingDirectory(context.externalsSrcDir):
         # Extract filename from URL and see if file already exists.
-        filename = url.split("/")[-1]
+        filename = AbsPath(url.split("/")[-1])
         if force and os.path.exists(filename):
             os.remove(filename)
 
+        # Archives that were already downloaded are shared between install
+        # directories through the download cache, and kept across forced
+        # builds.
+        cachePath = GetDownloadCachePath(context, url)
+        if (cachePath and not os.path.exists(filename) and
+            os.path.exists(cachePath)):
+            # Revalidate the cached archive against the ETag it was downloaded
+            # with, if any, in case the URL doesn't point to a fixed version.
+            # The cached archive is used if the server can't be reached.
+            cachedETag = None
+            if os.path.exists(cachePath + ".etag"):
+                with open(cachePath + ".etag", "r") as f:
+                    cachedETag = f.read().strip()
+            currentETag = GetURLETag(url) if cachedETag else None
+
+            if currentETag and currentETag != cachedETag:
+                PrintInfo("{0} changed on the server, ignoring the cached "
+                          "archive".format(url))
+            else:
+                PrintInfo("Copying {0} from the download cache"
+                          .format(filename))
+                tmpFilename = filename + ".tmp"
+                shutil.copyfile(cachePath, tmpFilename)
+                os.replace(tmpFilename, filename)
+
         if os.path.exists(filename):
             PrintInfo("{0} already exists, skipping download"
-                      .format(os.path.abspath(filename)))
+                      .format(filename))
         else:
             PrintInfo("Downloading {0} to {1}"
-                      .format(url, os.path.abspath(filename)))
+                      .format(url, filename))
 
             # To work around occasional hiccups with downloading from websites
             # (SSL validation errors, etc.), retry a few times if we don't
@@ -370,11 +1150,21 @@ def DownloadURL(url, context, force, extractDir = None, dontExtract = None, dest
             if os.path.exists(tmpFilename):
                 os.remove(tmpFilename)
 
+            etag = None
             for i in range(maxRetries):
+                if i > 0:
+                    # Back off a little more after each failure.
+                    time.sleep(DOWNLOAD_RETRY_BACKOFF * (2 ** (i - 1)) *
+                               random.uniform(0.5, 1.5))
                 try:
-                    context.downloader(url, tmpFilename)
+                    etag = context.downloader(url, tmpFilename)
                     break
                 except Exception as e:
+                    # Client errors like 404 won't go away by retrying.
+                    if (isinstance(e, urllib.error.HTTPError) and
+                        400 <= e.code < 500 and e.code not in (408, 429)):
+                        raise RuntimeError("Failed to download {url}: {err}"
+                                           .format(url=url, err=e))
                     PrintCommandOutput("Retrying download due to error: {err}\n"
                                        .format(err=e))
                     lastError = e
@@ -385,6 +1175,77 @@ def DownloadURL(url, context, force, extractDir = None, dontExtract = None, dest
 
             shutil.move(tmpFilename, filename)
 
+            if cachePath:
+                # Copy through a temporary file so that other installs never
+                # see a partially written archive in the cache.
+                os.makedirs(context.downloadCacheDir, exist_ok=True)
+                tmpCachePath = "{0}.{1}.tmp".format(cachePath, os.getpid())
+                shutil.copyfile(filename, tmpCachePath)
+                os.replace(tmpCachePath, cachePath)
+                if etag:
+                    with open(cachePath + ".etag", "w") as f:
+                        f.write(etag)
+                elif os.path.exists(cachePath + ".etag"):
+                    os.remove(cachePath + ".etag")
+
+        return filename
+
+def DownloadURL(url, context, force, extractDir = None, dontExtract = None, destDir = None):
+    """
+    Download and extract the archive file at given URL to the
+    source directory specified in the context.
+
+    dontExtract may be a sequence of path prefixes that will
+    be excluded when extracting the archive.
+
+    Returns the absolute path to the directory where files have
+    been extracted.
+    """
+    # Use the archive downloaded and extracted ahead of time if any, or do it
+    # now if that failed or was done with different arguments.
+    downloadArgs = dict(extractDir=extractDir, dontExtract=dontExtract,
+                        destDir=destDir)
+    prefetch = context.prefetchedDownloads.get(url)
+    if prefetch is not None:
+        prefetchArgs, future = prefetch
+        try:
+            extractedPath = future.result()
+            if prefetchArgs == downloadArgs:
+                return extractedPath
+        except Exception as e:
+            PrintWarning("Failed to download {url} ahead of time, "
+                         "downloading it again: {err}"
+                         .format(url=url, err=e))
+        # The archive is already downloaded (and extracted) with force.
+        force = False
+
+    return DownloadAndExtractURL(url, context, force, **downloadArgs)
+
+def DownloadAndExtractURL(url, context, force, extractDir = None, dontExtract = None,
+                          destDir = None):
+    """
+    Implements DownloadURL, without using the downloads done ahead of time.
+    """
+    with CurrentWorkingDirectory(context.externalsSrcDir):
+        filename = DownloadArchive(url, context, force)
+
+        # Skip opening the archive if it was already extracted. The name of
+        # its top-most directory is recorded next to the archive the first
+        # time it's opened, since finding it decompresses the start of tar
+        # archives. The recorded name is ignored if the archive is newer.
+        rootDirFilename = filename + ".rootdir"
+        knownPath = None
+        if destDir or extractDir:
+            knownPath = AbsPath(destDir or extractDir)
+        elif (os.path.exists(rootDirFilename) and
+              os.path.getmtime(rootDirFilename) >= os.path.getmtime(filename)):
+            with open(rootDirFilename, "r") as f:
+                knownPath = AbsPath(f.read().strip())
+        if knownPath and not force and os.path.isdir(knownPath):
+            PrintInfo("Directory {0} already exists, skipping extract"
+                      .format(knownPath))
+            return knownPath
+
         # Open the archive and retrieve the name of the top-most directory.
         # This assumes the archive contains a single directory with all
         # of the contents beneath it, unless a specific extractDir is specified,
@@ -392,35 +1253,48 @@ def DownloadURL(url, context, force, extractDir = None, dontExtract = None, dest
         archive = None
         rootDir = None
         members = None
+
+        # Match all the dontExtract patterns with a single regular expression,
+        # as each one is checked against thousands of members for boost.
+        if dontExtract != None:
+            dontExtractRegex = re.compile("|".join(
+                fnmatch.translate(p) for p in dontExtract) or "(?!)")
         try:
             if tarfile.is_tarfile(filename):
-                archive = tarfile.open(filename)
+                # Tar archives are read as a stream, so that the members are
+                # extracted as they are decompressed without indexing the
+                # entire archive first.
+                archive = tarfile.open(filename, "r|*")
                 if extractDir:
                     rootDir = extractDir
                 else:
-                    rootDir = archive.getnames()[0].split('/')[0]
+                    # Only read the first member instead of indexing the
+                    # entire archive.
+                    rootDir = archive.next().name.split('/')[0]
                 if dontExtract != None:
-                    members = (m for m in archive.getmembers()
-                               if not any((fnmatch.fnmatch(m.name, p)
-                                           for p in dontExtract)))
+                    members = (m for m in archive
+                               if not dontExtractRegex.match(m.name))
             elif zipfile.is_zipfile(filename):
                 archive = zipfile.ZipFile(filename)
                 if extractDir:
                     rootDir = extractDir
                 else:
-                    rootDir = archive.namelist()[0].split('/')[0]
+                    rootDir = archive.infolist()[0].filename.split('/')[0]
                 if dontExtract != None:
-                    members = (m for m in archive.getnames()
-                               if not any((fnmatch.fnmatch(m, p)
-                                           for p in dontExtract)))
+                    members = (m for m in archive.infolist()
+                               if not dontExtractRegex.match(m.filename))
             else:
                 raise RuntimeError("unrecognized archive file type")
 
+            if not extractDir:
+                with open(rootDirFilename, "w") as f:
+                    f.write(rootDir)
+
             with archive:
-                extractedPath = os.path.abspath(destDir if destDir else rootDir)
+                extractedPath = AbsPath(destDir if destDir else rootDir)
 
                 if force and os.path.isdir(extractedPath):
-                    shutil.rmtree(extractedPath)
+                    RemoveDirectory(context, extractedPath)
 
                 if os.path.isdir(extractedPath):
                     PrintInfo("Directory {0} already exists, skipping extract"
@@ -431,46 +1305,94 @@ def DownloadURL(url, context, force, extractDir = None, dontExtract = None, dest
                     # Extract to a temporary directory then move the contents
                     # to the expected location when complete. This ensures that
                     # incomplete extracts will be retried if the script is run
-                    # again.
-                    tmpExtractedPath = os.path.abspath("extract_dir")
+                    # again. Each archive has its own temporary directory since
+                    # several archives may be extracted at the same time. It is
+                    # next to the final location, so the files are only written
+                    # once and the move is a rename.
+                    tmpExtractedPath = AbsPath("extract_dir_" + os.path.basename(filename))
                     if os.path.isdir(tmpExtractedPath):
-                        shutil.rmtree(tmpExtractedPath)
+                        RemoveDirectory(context, tmpExtractedPath)
 
                     if destDir:
-                        archive.extractall(os.path.join(tmpExtractedPath, destDir), members=members)
-                        shutil.move(os.path.join(tmpExtractedPath, destDir), extractedPath)
+                        ExtractArchive(archive, filename,
+                                       os.path.join(tmpExtractedPath, destDir), members)
+                        os.replace(os.path.join(tmpExtractedPath, destDir), extractedPath)
                     else:
-                        archive.extractall(tmpExtractedPath, members=members)
-                        shutil.move(os.path.join(tmpExtractedPath, rootDir), extractedPath)
+                        ExtractArchive(archive, filename, tmpExtractedPath, members)
+                        os.replace(os.path.join(tmpExtractedPath, rootDir), extractedPath)
 
                     if os.path.isdir(tmpExtractedPath):
-                        shutil.rmtree(tmpExtractedPath)
+                        RemoveDirectory(context, tmpExtractedPath)
 
                 return extractedPath
         except Exception as e:
             # If extraction failed for whatever reason, assume the
             # archive file was bad and move it aside so that re-running
-            # the script will try downloading and extracting again.
+            # the script will try downloading and extracting again. The copy
+            # in the download cache is removed too, since it would be copied
+            # back otherwise.
             shutil.move(filename, filename + ".bad")
+            cachePath = GetDownloadCachePath(context, url)
+            if cachePath:
+                for path in (cachePath, cachePath + ".etag"):
+                    if os.path.exists(path):
+                        os.remove(path)
             raise RuntimeError("Failed to extract archive {filename}: {err}"
                                .format(filename=filename, err=e))
 
 def IsGitFolder(path = '.'):
-    return subprocess.call(['git', '-C', path, 'status'],
-                           stderr=subprocess.STDOUT,
-                           stdout = open(os.devnull, 'w')) == 0
+    return subprocess.run(['git', '-C', AbsPath(path), 'status'],
+                          stdout=subprocess.DEVNULL,
+                          stderr=subprocess.DEVNULL).returncode == 0
+
+# Maximum number of submodules cloned at the same time.
+MAX_PARALLEL_SUBMODULE_CLONES = 8
 
 def GitClone(url, tag, cloneDir, context):
+    """
+    Clone the given tag of the git repo at url to cloneDir in the source
+    directory specified in the context, unless it was already cloned.
+
+    Returns the absolute path to the cloned repo.
+    """
+    # Use the repo cloned ahead of time if any, or clone it now if that failed
+    # or was done with different arguments.
+    cloneArgs = dict(tag=tag, cloneDir=cloneDir)
+    prefetch = context.prefetchedDownloads.get(url)
+    if prefetch is not None:
+        prefetchArgs, future = prefetch
+        try:
+            clonedPath = future.result()
+            if prefetchArgs == cloneArgs:
+                return clonedPath
+        except Exception as e:
+            PrintWarning("Failed to clone {url} ahead of time, "
+                         "cloning it again: {err}"
+                         .format(url=url, err=e))
+
+    return CloneGitRepo(url, context, **cloneArgs)
+
+def CloneGitRepo(url, context, tag, cloneDir):
+    """
+    Implements GitClone, without using the repos cloned ahead of time.
+    """
     try:
         with CurrentWorkingDirectory(context.externalsSrcDir):
             # TODO check if cloneDir is a cloned folder of url
-            if not os.path.exists(cloneDir):
-                Run("git clone --recurse-submodules -b {tag} {url} {folder}".format(
-                    tag=tag, url=url, folder=cloneDir))
+            if not os.path.exists(AbsPath(cloneDir)):
+                # Only the tagged revision is needed, so skip the history and
+                # the other tags of the repo and of its submodules. The clone
+                # is never modified, so automatic garbage collection is
+                # disabled in it.
+                Run("git clone --depth 1 --single-branch --no-tags "
+                    "--recurse-submodules --shallow-submodules -c gc.auto=0 "
+                    "--jobs {jobs} -b {tag} {url} {folder}".format(
+                    jobs=MAX_PARALLEL_SUBMODULE_CLONES, tag=tag, url=url,
+                    folder=cloneDir))
             elif not IsGitFolder(cloneDir):
                 raise RuntimeError("Failed to clone repo {url} ({tag}): non-git folder {folder} exists".format(
                                     url=url, tag=tag, folder=cloneDir))
-            return os.path.abspath(cloneDir)
+            return AbsPath(cloneDir)
     except Exception as e:
         raise RuntimeError("Failed to clone repo {url} ({tag}): {err}".format(
                             url=url, tag=tag, err=e))
@@ -482,18 +1404,409 @@ def GitClone(url, tag, cloneDir, context):
 AllDependencies = list()
 AllDependenciesByName = dict()
 
+def IsFileInDirectoryListing(path, listings):
+    """
+    Returns True if path is an existing file. The directory containing it is
+    listed once with os.scandir and the listing is cached in listings, so
+    that checking several files in the same directory doesn't stat each of
+    them.
+    """
+    dirName, fileName = os.path.split(os.path.normcase(path))
+    names = listings.get(dirName)
+    if names is None:
+        try:
+            with os.scandir(dirName) as entries:
+                names = {os.path.normcase(e.name) for e in entries if e.is_file()}
+        except OSError:
+            names = set()
+        listings[dirName] = names
+    return fileName in names
+
 class Dependency(object):
-    def __init__(self, name, installer, *files):
+    def __init__(self, name, installer, *files, dependsOn=(), weight=1,
+                 downloadURL=None, downloadArgs=None, gitURL=None, gitArgs=None,
+                 fingerprintInputs=()):
         self.name = name
         self.installer = installer
         self.filesToCheck = files
 
+        # Functions and constants used by the installer besides its own
+        # source, such as the helpers it calls and the tables of build
+        # settings, which are part of the fingerprint of the dependency.
+        self.fingerprintInputs = fingerprintInputs
+
+        # URL of the archive downloaded by the installer, if any, and the
+        # other arguments it passes to DownloadURL, so that the archive can be
+        # downloaded and extracted ahead of time.
+        self.downloadURL = downloadURL
+        self.downloadArgs = downloadArgs or dict()
+
+        # URL of the git repo cloned by the installer, if any, and the other
+        # arguments it passes to GitClone, so that the repo can be cloned
+        # ahead of time.
+        self.gitURL = gitURL
+        self.gitArgs = gitArgs or dict()
+
+        # Dependencies that must be installed before this one.
+        self.dependsOn = dependsOn
+
+        # Rough build time of the dependency in minutes, used to install the
+        # longest chains of dependencies first.
+        self.weight = weight
+
         AllDependencies.append(self)
         AllDependenciesByName.setdefault(name.lower(), self)
 
-    def Exists(self, context):
-        return all([os.path.isfile(os.path.join(context.externalsInstDir, config, f))
-                    for f in self.filesToCheck for config in BuildConfigs(context)])
+    def Exists(self, context, listings=None):
+        """
+        Returns True if the files to check exist for all the configurations.
+        listings may be a dict shared between calls, in which the directory
+        listings read to check the files are cached.
+        """
+        if listings is None:
+            listings = dict()
+        return all(IsFileInDirectoryListing(os.path.join(context.configInstDirs[config], f),
+                                            listings)
+                   for f in self.filesToCheck for config in context.buildConfigs)
+
+    def GetFingerprint(self, context):
+        """
+        Returns a hash of the inputs of the installation of the dependency:
+        the source of its installer and of its other fingerprint inputs, its
+        download or git URL and arguments, the user-specified build arguments,
+        the build options and the compiler, or the URL of its prebuilt
+        archives.
+        """
+        def GetSource(function):
+            try:
+                return inspect.getsource(function)
+            except (OSError, TypeError):
+                return function.__name__
+
+        prebuiltURL = context.GetPrebuiltURL(self)
+        if prebuiltURL:
+            inputs = [prebuiltURL]
+        else:
+            inputs = [GetSource(self.installer)]
+            inputs += [GetSource(i) if callable(i) else repr(i)
+                       for i in self.fingerprintInputs]
+            inputs += [self.downloadURL or "",
+                       repr(sorted(self.downloadArgs.items())),
+                       self.gitURL or "", repr(sorted(self.gitArgs.items()))]
+            inputs += context.GetBuildArguments(self)
+            inputs += [repr(context.unityBuild), context.cmakeGenerator or "",
+                       context.cmakeToolset or ""]
+            inputs.append(GetCompilerId())
+
+        fingerprint = hashlib.blake2b(digest_size=16)
+        for i in inputs:
+            fingerprint.update(i.encode("utf-8") + b"\0")
+        return fingerprint.hexdigest()
+
+    def GetFingerprintPath(self, context, config):
+        return os.path.join(context.configInstDirs[config], ".aurora_fingerprints",
+                            self.name)
+
+    def IsUpToDate(self, context, listings=None):
+        """
+        Returns True if the dependency exists and was installed with the same
+        inputs as the current ones. Dependencies installed before fingerprints
+        were recorded are assumed to be up to date.
+        """
+        if not self.Exists(context, listings):
+            return False
+
+        # The fingerprint is only computed if there is one to compare it to,
+        # since it runs the compiler to identify it.
+        fingerprint = None
+        for config in context.buildConfigs:
+            try:
+                with open(self.GetFingerprintPath(context, config), "r") as f:
+                    recordedFingerprint = f.read().strip()
+            except FileNotFoundError:
+                continue
+            if fingerprint is None:
+                fingerprint = self.GetFingerprint(context)
+            if recordedFingerprint != fingerprint:
+                return False
+        return True
+
+    def UpdateFingerprint(self, context):
+        fingerprint = self.GetFingerprint(context)
+        for config in context.buildConfigs:
+            path = self.GetFingerprintPath(context, config)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(fingerprint)
+
+def GetDependencyPriorities(dependencies):
+    """
+    Returns a dict with the priority of each of the given dependencies: its
+    weight plus the highest priority of the dependencies that depend on it,
+    i.e. the build time of the longest chain of dependencies that starts
+    with it.
+    """
+    priorities = dict()
+    def GetPriority(dep):
+        if dep not in priorities:
+            priorities[dep] = dep.weight + max(
+                [GetPriority(d) for d in dependencies if dep in d.dependsOn],
+                default=0)
+        return priorities[dep]
+
+    for dep in dependencies:
+        GetPriority(dep)
+    return priorities
+
+def InstallPrebuiltDependency(context, dep, url):
+    """
+    Installs the given dependency from prebuilt archives instead of building
+    it. The URL may contain a {config} placeholder for the configuration, and
+    each archive must contain the install tree (include, lib, etc.) of the
+    dependency, optionally in a single top-level directory.
+    """
+    for config in context.buildConfigs:
+        configURL = url.format(config=config)
+        extractedDir = DownloadURL(configURL, context, False,
+                                   destDir="{name}-prebuilt-{config}".format(
+                                       name=dep.name, config=config))
+        entries = os.listdir(extractedDir)
+        if len(entries) == 1 and os.path.isdir(os.path.join(extractedDir, entries[0])):
+            extractedDir = os.path.join(extractedDir, entries[0])
+        CopyDirectory(context, extractedDir, "", config)
+
+def GetBuildCachePath(context, dep, config):
+    """
+    Returns the path of the install tree of the given configuration of the
+    dependency in the build cache, or None if the build cache is disabled.
+
+    The path is keyed by the fingerprint of the dependency and of the
+    dependencies it depends on (which include the compiler), the rest of the
+    toolchain, the configuration and the install directory, since installed
+    files (e.g. CMake config files) may contain absolute paths.
+    """
+    if not context.buildCacheDir:
+        return None
+
+    inputs = []
+    visited = set()
+    def AddFingerprints(dep):
+        if dep not in visited:
+            visited.add(dep)
+            inputs.append(dep.GetFingerprint(context))
+            for d in dep.dependsOn:
+                AddFingerprints(d)
+    AddFingerprints(dep)
+    inputs += [PLATFORM_SYSTEM, platform.machine(), repr(GetCMakeVersion()), context.cmakeGenerator or "",
+               context.cmakeToolset or "", repr(context.unityBuild),
+               config, context.configInstDirs[config]]
+
+    key = hashlib.blake2b(digest_size=16)
+    for i in inputs:
+        key.update(i.encode("utf-8") + b"\0")
+    return os.path.join(context.buildCacheDir,
+                        "{name}-{key}".format(name=dep.name, key=key.hexdigest()))
+
+def CopyInstalledFile(src, dst):
+    """
+    Copy the installed file src to dst, preserving symbolic links and
+    permissions. The files are copied rather than hard linked, since
+    installing a file again may overwrite it in place.
+    """
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if os.path.islink(src):
+        shutil.copy2(src, dst, follow_symlinks=False)
+    else:
+        CloneOrCopyFile(src, dst)
+
+def GetBuildCachePaths(context, dep):
+    """
+    Returns a dict with the paths of the install trees of the dependency in
+    the build cache for each configuration, or None if they are not all in
+    the cache.
+    """
+    cachePaths = {config: GetBuildCachePath(context, dep, config)
+                  for config in context.buildConfigs}
+    if not all(path and os.path.isdir(path) for path in cachePaths.values()):
+        return None
+    return cachePaths
+
+def RestoreFromBuildCache(context, dep):
+    """
+    Installs the given dependency from the build cache, if its install trees
+    for all the configurations are in the cache. Returns True if it was
+    installed.
+    """
+    cachePaths = GetBuildCachePaths(context, dep)
+    if not cachePaths:
+        return False
+
+    PrintInfo("Installing {dep} from the build cache".format(dep=dep.name))
+    for config, cachePath in cachePaths.items():
+        # Mark the entry as recently used, so that it is evicted last.
+        os.utime(cachePath)
+        instDir = context.configInstDirs[config]
+        for root, dirs, files in os.walk(cachePath):
+            for f in files + [d for d in dirs if os.path.islink(os.path.join(root, d))]:
+                src = os.path.join(root, f)
+                CopyInstalledFile(src, os.path.join(instDir,
+                                                    os.path.relpath(src, cachePath)))
+    return True
+
+def StoreInBuildCache(context, dep, installedFiles):
+    """
+    Stores the given files installed by the dependency in the build cache.
+    Nothing is stored if no files were recorded, e.g. for boost, which is
+    installed by b2.
+    """
+    for config in context.buildConfigs:
+        cachePath = GetBuildCachePath(context, dep, config)
+        instDir = context.configInstDirs[config]
+        files = [f for f in installedFiles
+                 if os.path.lexists(f) and
+                    os.path.commonpath([f, instDir]) == instDir]
+        if not cachePath or not files or os.path.isdir(cachePath):
+            continue
+
+        # Copy the files to a temporary directory first, so that the cache
+        # never contains partial install trees.
+        tmpPath = "{path}.tmp-{id}".format(path=cachePath, id=uuid.uuid4().hex)
+        try:
+            for f in files:
+                CopyInstalledFile(f, os.path.join(tmpPath, os.path.relpath(f, instDir)))
+            os.rename(tmpPath, cachePath)
+        except OSError as e:
+            PrintWarning("Failed to store {dep} in the build cache: {err}"
+                         .format(dep=dep.name, err=e))
+            shutil.rmtree(tmpPath, ignore_errors=True)
+
+def GetDirectorySize(path):
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for f in files:
+            try:
+                size += os.lstat(os.path.join(root, f)).st_size
+            except OSError:
+                pass
+    return size
+
+def TrimBuildCache(context):
+    """
+    Removes the least recently used install trees from the build cache until
+    its size is within context.buildCacheMaxSize.
+    """
+    try:
+        with os.scandir(context.buildCacheDir) as entries:
+            entries = [(e.stat().st_mtime, e.path) for e in entries
+                       if e.is_dir(follow_symlinks=False) and ".tmp-" not in e.name]
+    except OSError:
+        return
+
+    sizes = {path: GetDirectorySize(path) for _, path in entries}
+    totalSize = sum(sizes.values())
+    for _, path in sorted(entries):
+        if totalSize <= context.buildCacheMaxSize:
+            break
+        PrintInfo("Removing {path} from the build cache".format(path=path))
+        shutil.rmtree(path, ignore_errors=True)
+        totalSize -= sizes[path]
+
+def InstallDependency(context, dep):
+    PrintStatus("Installing {dep}...".format(dep=dep.name))
+
+    # Each installer gets its own copy of the context, so that the settings it
+    # changes temporarily (e.g. the CMake generator) don't affect installers
+    # running at the same time.
+    depContext = copy.copy(context)
+
+    force = context.ForceBuildDependency(dep)
+    prebuiltURL = context.GetPrebuiltURL(dep)
+    if prebuiltURL and not force:
+        InstallPrebuiltDependency(depContext, dep, prebuiltURL)
+    elif not context.UseBuildCache(dep):
+        dep.installer(depContext,
+                      buildArgs=context.GetBuildArguments(dep),
+                      force=force)
+    elif not RestoreFromBuildCache(context, dep):
+        # Record the files installed by the installer, to store them in the
+        # build cache.
+        threadState.installedFiles = set()
+        try:
+            dep.installer(depContext,
+                          buildArgs=context.GetBuildArguments(dep),
+                          force=force)
+            StoreInBuildCache(context, dep, threadState.installedFiles)
+        finally:
+            threadState.installedFiles = None
+    dep.UpdateFingerprint(context)
+
+# Maximum number of archives downloaded at the same time.
+MAX_PARALLEL_DOWNLOADS = 8
+
+def InstallDependencies(context, dependencies):
+    """
+    Installs the given dependencies, each one as soon as the dependencies it
+    depends on are installed. Up to context.parallelDeps dependencies are
+    installed at the same time, sharing the build jobs of
+    context.buildJobPool. The dependencies with
+    the longest chains of dependencies after them are started first.
+    """
+    priorities = GetDependencyPriorities(dependencies)
+
+    # Download and extract the archives of all the dependencies in the
+    # background, so that the downloads overlap with each other, with the
+    # extraction of the archives already downloaded, and with the builds.
+    # The dependencies that will be installed from prebuilt archives or from
+    # the build cache don't need their sources.
+    prefetcher = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_PARALLEL_DOWNLOADS)
+    try:
+        for dep in sorted(dependencies, key=lambda dep: priorities[dep], reverse=True):
+            if (context.GetPrebuiltURL(dep) or
+                (context.UseBuildCache(dep) and GetBuildCachePaths(context, dep))):
+                continue
+            if dep.downloadURL:
+                downloadArgs = dict(extractDir=None, dontExtract=None,
+                                    destDir=None)
+                downloadArgs.update(dep.downloadArgs)
+                context.prefetchedDownloads[dep.downloadURL] = (
+                    downloadArgs,
+                    prefetcher.submit(DownloadAndExtractURL, dep.downloadURL, context,
+                                      context.ForceBuildDependency(dep), **downloadArgs))
+            if dep.gitURL:
+                context.prefetchedDownloads[dep.gitURL] = (
+                    dep.gitArgs,
+                    prefetcher.submit(CloneGitRepo, dep.gitURL, context, **dep.gitArgs))
+
+        pending = sorted(dependencies, key=lambda dep: priorities[dep], reverse=True)
+        running = dict()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=context.parallelDeps) as executor:
+            while pending or running:
+                # Start the dependencies whose own dependencies are installed
+                # as soon as a worker is free, instead of waiting for all the
+                # dependencies started before them.
+                ready = [dep for dep in pending
+                         if not any(d in pending or d in running.values()
+                                    for d in dep.dependsOn)]
+                if not ready and not running:
+                    raise RuntimeError("Circular dependency between {deps}".format(
+                        deps=", ".join(d.name for d in pending)))
+
+                for dep in ready[:context.parallelDeps - len(running)]:
+                    pending.remove(dep)
+                    running[executor.submit(InstallDependency, context, dep)] = dep
+
+                done, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+                    future.result()
+    finally:
+        prefetcher.shutdown(cancel_futures=True)
+
+    if context.buildCacheDir:
+        TrimBuildCache(context)
 
 ############################################################
 # zlib
@@ -504,7 +1817,8 @@ def InstallZlib(context, force, buildArgs):
     with CurrentWorkingDirectory(DownloadURL(ZLIB_URL, context, force)):
         RunCMake(context, force, buildArgs)
 
-ZLIB = Dependency("zlib", InstallZlib, "include/zlib.h")
+ZLIB = Dependency("zlib", InstallZlib, "include/zlib.h",
+                  downloadURL=ZLIB_URL)
 
 ############################################################
 # boost
@@ -523,44 +1837,52 @@ elif Windows():
     BOOST_URL = "https://boostorg.jfrog.io/artifactory/main/release/1.70.0/source/boost_1_70_0.tar.gz"
     BOOST_VERSION_FILE = "include/boost-1_70/boost/version.hpp"
 
-def InstallBoost_Helper(context, force, buildArgs):
-    # Documentation files in the boost archive can have exceptionally
-    # long paths. This can lead to errors when extracting boost on Windows,
-    # since paths are limited to 260 characters by default on that platform.
-    # To avoid this, we skip extracting all documentation.
-    #
-    # For some examples, see: https://svn.boost.org/trac10/ticket/11677
-    dontExtract = [
-        "*/doc/*",
-        "*/libs/*/doc/*",
-        "*/libs/wave/test/testwave/testfiles/utf8-test-*"
-    ]
+# Compiled boost libraries that are built. USD is built without python
+# support, so boost.python isn't needed.
+BOOST_LIBRARIES = [
+    "atomic",
+    "program_options",
+    "regex",
+    # Required by OpenImageIO
+    "date_time",
+    "system",
+    "thread",
+    "filesystem"
+]
+
+# Documentation files in the boost archive can have exceptionally
+# long paths. This can lead to errors when extracting boost on Windows,
+# since paths are limited to 260 characters by default on that platform.
+# To avoid this, we skip extracting all documentation.
+#
+# For some examples, see: https://svn.boost.org/trac10/ticket/11677
+BOOST_DONT_EXTRACT = [
+    "*/doc/*",
+    "*/libs/*/doc/*",
+    "*/libs/wave/test/testwave/testfiles/utf8-test-*"
+]
 
+def InstallBoost_Helper(context, force, buildArgs):
     with CurrentWorkingDirectory(DownloadURL(BOOST_URL, context, force,
-                                             dontExtract=dontExtract)):
-        bootstrap = "bootstrap.bat" if Windows() else "./bootstrap.sh"
-        Run(f'{bootstrap}')
-
-        # b2 supports at most -j64 and will error if given a higher value.
-        numProc = min(64, context.numJobs)
+                                             dontExtract=BOOST_DONT_EXTRACT)):
+        # Building b2 takes a while, so only bootstrap if it's not already
+        # built from a previous run.
+        b2Path = AbsPath("b2.exe" if Windows() else "b2")
+        if force or not os.path.isfile(b2Path):
+            bootstrap = AbsPath("bootstrap.bat" if Windows() else "bootstrap.sh")
+            Run([bootstrap])
 
         b2Settings = [
-            f'--build-dir="{context.buildDir}"',
-            f'-j{numProc}',
+            f'--build-dir={context.buildDir}',
             'address-model=64',
             'link=shared',
             'runtime-link=shared',
-            'threading=multi',
-            '--with-atomic',
-            '--with-program_options',
-            '--with-regex'
+            'threading=multi'
         ]
 
-        # Required by OpenImageIO
-        b2Settings.append("--with-date_time")
-        b2Settings.append("--with-system")
-        b2Settings.append("--with-thread")
-        b2Settings.append("--with-filesystem")
+        # Only build the compiled libraries used by OpenImageIO and USD; the
+        # other libraries (python, wave, graph, etc.) are skipped.
+        b2Settings += ['--with-{}'.format(lib) for lib in BOOST_LIBRARIES]
 
         if force:
             b2Settings.append("-a")
@@ -576,26 +1898,32 @@ def InstallBoost_Helper(context, force, buildArgs):
                 b2Settings.append("toolset=msvc-14.2")
 
         # Add on any user-specified extra arguments.
-        b2Settings += buildArgs
+        b2Settings += [a for arg in buildArgs for a in shlex.split(arg)]
 
-        b2 = "b2" if Windows() else "./b2"
+        b2 = AbsPath("b2")
 
         # boost only accepts three variants: debug, release, profile
         b2ExtraSettings = []
         if context.buildDebug:
-            b2ExtraSettings.append('--prefix="{}" variant=debug --debug-configuration'.format(
-                os.path.join(context.externalsInstDir, 'Debug')))
+            b2ExtraSettings.append(['--prefix={}'.format(context.configInstDirs['Debug']),
+                                    'variant=debug', '--debug-configuration'])
         if context.buildRelease:
-            b2ExtraSettings.append('--prefix="{}" variant=release'.format(
-                os.path.join(context.externalsInstDir, 'Release')))
+            b2ExtraSettings.append(['--prefix={}'.format(context.configInstDirs['Release']),
+                                    'variant=release'])
         if context.buildRelWithDebInfo:
-            b2ExtraSettings.append('--prefix="{}" variant=profile'.format(
-                os.path.join(context.externalsInstDir, 'RelWithDebInfo')))
+            b2ExtraSettings.append(['--prefix={}'.format(context.configInstDirs['RelWithDebInfo']),
+                                    'variant=profile'])
 
+        # b2 installs to a single prefix, so it is run once per variant. The
+        # runs share the build directory, in which b2 keeps the objects of
+        # each variant apart, so a run only builds its own variant and the
+        # later runs of a rebuild reuse their up to date objects.
+        # b2 supports at most -j64 and will error if given a higher value.
+        # Compiling boost on more jobs than physical cores only adds memory
+        # pressure.
         for extraSettings in b2ExtraSettings:
-            b2Settings.append(extraSettings)
-            Run('{b2} {options} install'.format(b2=b2, options=" ".join(b2Settings)))
-            b2Settings.pop()
+            with context.buildJobPool.Acquire(min(64, GetPhysicalCPUCount())) as numProc:
+                Run([b2, f'-j{numProc}'] + b2Settings + extraSettings + ['install'])
 
 def InstallBoost(context, force, buildArgs):
     # Boost's build system will install the version.hpp header before
@@ -605,14 +1933,22 @@ def InstallBoost(context, force, buildArgs):
     try:
         InstallBoost_Helper(context, force, buildArgs)
     except:
-        for config in BuildConfigs(context):
-            versionHeader = os.path.join(context.externalsInstDir, config, BOOST_VERSION_FILE)
+        for config in context.buildConfigs:
+            versionHeader = os.path.join(context.configInstDirs[config], BOOST_VERSION_FILE)
             if os.path.isfile(versionHeader):
                 try: os.remove(versionHeader)
                 except: pass
         raise
 
-BOOST = Dependency("boost", InstallBoost, BOOST_VERSION_FILE)
+BOOST = Dependency("boost", InstallBoost, BOOST_VERSION_FILE, weight=15,
+                   downloadURL=BOOST_URL,
+                   downloadArgs=dict(dontExtract=BOOST_DONT_EXTRACT),
+                   fingerprintInputs=[InstallBoost_Helper, BOOST_LIBRARIES])
+
+# CMake arguments making sure to use boost installed by the build script and
+# not any system installed boost.
+BOOST_NO_SYSTEM_ARGS = ('-DBoost_NO_BOOST_CMAKE=On',
+                        '-DBoost_NO_SYSTEM_PATHS=True')
 
 ############################################################
 # Intel TBB
@@ -620,8 +1956,10 @@ BOOST = Dependency("boost", InstallBoost, BOOST_VERSION_FILE)
 if Windows():
     TBB_URL = "https://github.com/oneapi-src/oneTBB/releases/download/2019_U6/tbb2019_20190410oss_win.zip"
     TBB_ROOT_DIR_NAME = "tbb2019_20190410oss"
+    TBB_DOWNLOAD_ARGS = dict(extractDir=TBB_ROOT_DIR_NAME)
 else:
     TBB_URL = "https://github.com/oneapi-src/oneTBB/archive/refs/tags/2019_U6.tar.gz"
+    TBB_DOWNLOAD_ARGS = dict()
 
 def InstallTBB(context, force, buildArgs):
     if Windows():
@@ -630,7 +1968,8 @@ def InstallTBB(context, force, buildArgs):
         InstallTBB_Linux(context, force, buildArgs)
 
 def InstallTBB_Windows(context, force, buildArgs):
-    with CurrentWorkingDirectory(DownloadURL(TBB_URL, context, force, TBB_ROOT_DIR_NAME)):
+    with CurrentWorkingDirectory(DownloadURL(TBB_URL, context, force,
+                                             extractDir=TBB_ROOT_DIR_NAME)):
         # On Windows, we simply copy headers and pre-built DLLs to
         # the appropriate location.
         if buildArgs:
@@ -638,28 +1977,41 @@ def InstallTBB_Windows(context, force, buildArgs):
                          "not built from source on this platform."
                          .format(buildArgs))
 
-        for config in BuildConfigs(context):
+        for config in context.buildConfigs:
             CopyFiles(context, "bin/intel64/vc14/*.*", "bin", config)
             CopyFiles(context, "lib/intel64/vc14/*.*", "lib", config)
-            CopyDirectory(context, "include/serial", "include/serial", config)
-            CopyDirectory(context, "include/tbb", "include/tbb", config)
+            CopyDirectory(context, "include/serial", "include/serial", config, force,
+                          link=True)
+            CopyDirectory(context, "include/tbb", "include/tbb", config, force,
+                          link=True)
 
 def InstallTBB_Linux(context, force, buildArgs):
     with CurrentWorkingDirectory(DownloadURL(TBB_URL, context, force)):
         # TBB does not support out-of-source builds in a custom location.
-        Run('make -j{procs} {buildArgs}'
-            .format(procs=context.numJobs,
-                    buildArgs=" ".join(buildArgs)))
+        with context.buildJobPool.Acquire(GetPhysicalCPUCount()) as numJobs:
+            Run(['make', '-j{}'.format(numJobs)]
+                + [a for arg in buildArgs for a in shlex.split(arg)])
 
-        for config in BuildConfigs(context):
+        for config in context.buildConfigs:
             if (config == "Release" or config == "RelWithDebInfo"):
                 CopyFiles(context, "build/*_release/libtbb*.*", "lib", config)
             if (config == "Debug"):
                 CopyFiles(context, "build/*_debug/libtbb*.*", "lib", config)
-            CopyDirectory(context, "include/serial", "include/serial", config)
-            CopyDirectory(context, "include/tbb", "include/tbb", config)
-
-TBB = Dependency("TBB", InstallTBB, "include/tbb/tbb.h")
+            CopyDirectory(context, "include/serial", "include/serial", config, force,
+                          link=True)
+            CopyDirectory(context, "include/tbb", "include/tbb", config, force,
+                          link=True)
+
+TBB = Dependency("TBB", InstallTBB, "include/tbb/tbb.h", weight=3,
+                 downloadURL=TBB_URL, downloadArgs=TBB_DOWNLOAD_ARGS,
+                 fingerprintInputs=[InstallTBB_Windows, InstallTBB_Linux])
+
+# CMake arguments selecting the TBB libraries matching each configuration.
+TBB_CONFIGS = {
+    "Debug": '-DTBB_USE_DEBUG_BUILD=ON',
+    "Release": '-DTBB_USE_DEBUG_BUILD=OFF',
+    "RelWithDebInfo": '-DTBB_USE_DEBUG_BUILD=OFF',
+}
 
 ############################################################
 # JPEG
@@ -670,7 +2022,8 @@ def InstallJPEG(context, force, buildArgs):
     with CurrentWorkingDirectory(DownloadURL(JPEG_URL, context, force)):
         RunCMake(context, force, buildArgs)
 
-JPEG = Dependency("JPEG", InstallJPEG, "include/jpeglib.h")
+JPEG = Dependency("JPEG", InstallJPEG, "include/jpeglib.h",
+                  downloadURL=JPEG_URL)
 
 ############################################################
 # TIFF
@@ -702,7 +2055,9 @@ def InstallTIFF(context, force, buildArgs):
         extraArgs += buildArgs
         RunCMake(context, force, extraArgs)
 
-TIFF = Dependency("TIFF", InstallTIFF, "include/tiff.h")
+TIFF = Dependency("TIFF", InstallTIFF, "include/tiff.h",
+                  dependsOn=[ZLIB, JPEG],
+                  downloadURL=TIFF_URL)
 
 ############################################################
 # PNG
@@ -713,7 +2068,9 @@ def InstallPNG(context, force, buildArgs):
     with CurrentWorkingDirectory(DownloadURL(PNG_URL, context, force)):
         RunCMake(context, force, buildArgs)
 
-PNG = Dependency("PNG", InstallPNG, "include/png.h")
+PNG = Dependency("PNG", InstallPNG, "include/png.h",
+                 dependsOn=[ZLIB],
+                 downloadURL=PNG_URL)
 
 ############################################################
 # GLM
@@ -723,11 +2080,12 @@ GLM_URL = "https://github.com/g-truc/glm/archive/refs/tags/0.9.9.8.zip"
 # TODO is the install structure proper?
 def InstallGLM(context, force, buildArgs):
     with CurrentWorkingDirectory(DownloadURL(GLM_URL, context, force)):
-        for config in BuildConfigs(context):
-            CopyDirectory(context, "glm", "glm", config)
-            CopyDirectory(context, "cmake/glm", "cmake/glm", config)
+        for config in context.buildConfigs:
+            CopyDirectory(context, "glm", "glm", config, force)
+            CopyDirectory(context, "cmake/glm", "cmake/glm", config, force)
 
-GLM = Dependency("GLM", InstallGLM, "glm/glm.hpp")
+GLM = Dependency("GLM", InstallGLM, "glm/glm.hpp",
+                 downloadURL=GLM_URL)
 
 ############################################################
 # STB
@@ -736,10 +2094,11 @@ STB_URL = "https://github.com/nothings/stb/archive/refs/heads/master.zip"
 
 def InstallSTB(context, force, buildArgs):
     with CurrentWorkingDirectory(DownloadURL(STB_URL, context, force)):
-        for config in BuildConfigs(context):
+        for config in context.buildConfigs:
             CopyFiles(context, "*.h", "include", config)
 
-STB = Dependency("STB", InstallSTB, "include/stb_image.h")
+STB = Dependency("STB", InstallSTB, "include/stb_image.h",
+                 downloadURL=STB_URL)
 
 ############################################################
 # TinyGLTF
@@ -750,7 +2109,8 @@ def InstallTinyGLTF(context, force, buildArgs):
     with CurrentWorkingDirectory(DownloadURL(TinyGLTF_URL, context, force)):
         RunCMake(context, force, buildArgs)
 
-TINYGLTF = Dependency("TinyGLTF", InstallTinyGLTF, "include/tiny_gltf.h")
+TINYGLTF = Dependency("TinyGLTF", InstallTinyGLTF, "include/tiny_gltf.h",
+                      downloadURL=TinyGLTF_URL)
 
 ############################################################
 # TinyObjLoader
@@ -761,7 +2121,8 @@ def InstallTinyObjLoader(context, force, buildArgs):
     with CurrentWorkingDirectory(DownloadURL(TinyObjLoader_URL, context, force)):
         RunCMake(context, force, buildArgs)
 
-TINYOBJLOADER = Dependency("TinyObjLoader", InstallTinyObjLoader, "include/tiny_obj_loader.h")
+TINYOBJLOADER = Dependency("TinyObjLoader", InstallTinyObjLoader, "include/tiny_obj_loader.h",
+                           downloadURL=TinyObjLoader_URL)
 
 ############################################################
 # IlmBase/OpenEXR
@@ -784,17 +2145,15 @@ def InstallOpenEXR(context, force, buildArgs):
         extraArgs += buildArgs
 
         packageConfigs = {
-            "Debug": '-DOPENEXR_PACKAGE_PREFIX="{}"'.format(
-                os.path.join(context.externalsInstDir, 'Debug')),
-            "Release": '-DOPENEXR_PACKAGE_PREFIX="{}"'.format(
-                os.path.join(context.externalsInstDir, 'Release')),
-            "RelWithDebInfo": '-DOPENEXR_PACKAGE_PREFIX="{}"'.format(
-                os.path.join(context.externalsInstDir, 'RelWithDebInfo'))
+            config: '-DOPENEXR_PACKAGE_PREFIX="{}"'.format(instDir)
+            for config, instDir in context.configInstDirs.items()
         }
 
         RunCMake(context, force, extraArgs, configExtraArgs = packageConfigs)
 
-OPENEXR = Dependency("OpenEXR", InstallOpenEXR, "include/OpenEXR/ImfVersion.h")
+OPENEXR = Dependency("OpenEXR", InstallOpenEXR, "include/OpenEXR/ImfVersion.h",
+                     dependsOn=[ZLIB], weight=5,
+                     downloadURL=OPENEXR_URL)
 
 ############################################################
 # OpenImageIO
@@ -809,10 +2168,9 @@ def InstallOpenImageIO(context, force, buildArgs):
                      '-DSTOP_ON_WARNING=OFF',
                      '-DUSE_PTEX=OFF']
 
-        # Make sure to use boost installed by the build script and not any
-        # system installed boost
-        extraArgs.append('-DBoost_NO_BOOST_CMAKE=On')
-        extraArgs.append('-DBoost_NO_SYSTEM_PATHS=True')
+        extraArgs += BOOST_NO_SYSTEM_ARGS
+
+        extraArgs += GetUnityBuildArgs(context)
 
         # Add on any user-specified extra arguments.
         extraArgs += buildArgs
@@ -825,18 +2183,18 @@ def InstallOpenImageIO(context, force, buildArgs):
         # This may lead to undefined symbol errors at build or runtime.
         # So, we explicitly specify the OpenEXR we want to use here.
         openEXRConfigs = {
-            "Debug": '-DOPENEXR_ROOT="{}"'.format(
-                os.path.join(context.externalsInstDir, 'Debug')),
-            "Release": '-DOPENEXR_ROOT="{}"'.format(
-                os.path.join(context.externalsInstDir, 'Release')),
-            "RelWithDebInfo": '-DOPENEXR_ROOT="{}"'.format(
-                os.path.join(context.externalsInstDir, 'RelWithDebInfo')),
+            config: '-DOPENEXR_ROOT="{}"'.format(instDir)
+            for config, instDir in context.configInstDirs.items()
         }
 
         RunCMake(context, force, extraArgs, configExtraArgs = openEXRConfigs)
 
 OPENIMAGEIO = Dependency("OpenImageIO", InstallOpenImageIO,
-                         "include/OpenImageIO/oiioversion.h")
+                         "include/OpenImageIO/oiioversion.h",
+                         dependsOn=[ZLIB, JPEG, TIFF, PNG, BOOST, TBB, OPENEXR],
+                         weight=10,
+                         downloadURL=OIIO_URL,
+                         fingerprintInputs=[BOOST_NO_SYSTEM_ARGS])
 
 ############################################################
 # OpenSubdiv
@@ -868,6 +2226,8 @@ def InstallOpenSubdiv(context, force, buildArgs):
         # tbbmalloc.
         extraArgs.append('-DNO_TBB=ON')
 
+        extraArgs += GetUnityBuildArgs(context)
+
         # Add on any user-specified extra arguments.
         extraArgs += buildArgs
 
@@ -878,16 +2238,14 @@ def InstallOpenSubdiv(context, force, buildArgs):
         if oldGenerator == "Ninja" and Windows():
             context.cmakeGenerator = None
 
-        oldNumJobs = context.numJobs
-
         try:
             RunCMake(context, force, extraArgs)
         finally:
             context.cmakeGenerator = oldGenerator
-            context.numJobs = oldNumJobs
 
 OPENSUBDIV = Dependency("OpenSubdiv", InstallOpenSubdiv,
-                        "include/opensubdiv/version.h")
+                        "include/opensubdiv/version.h", weight=5,
+                        downloadURL=OPENSUBDIV_URL)
 
 ############################################################
 # MaterialX
@@ -898,11 +2256,15 @@ def InstallMaterialX(context, force, buildArgs):
     with CurrentWorkingDirectory(DownloadURL(MATERIALX_URL, context, force)):
         cmakeOptions = ['-DMATERIALX_BUILD_SHARED_LIBS=ON']
 
+        cmakeOptions += GetUnityBuildArgs(context)
+
         cmakeOptions += buildArgs
 
         RunCMake(context, force, cmakeOptions)
 
-MATERIALX = Dependency("MaterialX", InstallMaterialX, "include/MaterialXCore/Library.h")
+MATERIALX = Dependency("MaterialX", InstallMaterialX, "include/MaterialXCore/Library.h",
+                       weight=3,
+                       downloadURL=MATERIALX_URL)
 
 ############################################################
 # USD
@@ -953,27 +2315,27 @@ def InstallUSD(context, force, buildArgs):
         # Turn off the text system in USD (Autodesk extension)
         extraArgs.append('-DPXR_ENABLE_TEXT_SUPPORT=OFF')
 
-        if Windows():
-            # Increase the precompiled header buffer limit.
+        if Windows() and not IsVisualStudio2022OrGreater():
+            # Increase the precompiled header buffer limit. This raises the
+            # memory used by each compiler process, so it is only done for
+            # the older compilers that need it.
             extraArgs.append('-DCMAKE_CXX_FLAGS="/Zm150"')
 
-        # Make sure to use boost installed by the build script and not any
-        # system installed boost
-        extraArgs.append('-DBoost_NO_BOOST_CMAKE=On')
-        extraArgs.append('-DBoost_NO_SYSTEM_PATHS=True')
+        extraArgs += BOOST_NO_SYSTEM_ARGS
 
         extraArgs.append('-DPXR_LIB_PREFIX=')
 
+        extraArgs += GetUnityBuildArgs(context)
+
         extraArgs += buildArgs
 
-        tbbConfigs = {
-            "Debug": '-DTBB_USE_DEBUG_BUILD=ON',
-            "Release": '-DTBB_USE_DEBUG_BUILD=OFF',
-            "RelWithDebInfo": '-DTBB_USE_DEBUG_BUILD=OFF',
-        }
-        RunCMake(context, force, extraArgs, configExtraArgs=tbbConfigs)
+        RunCMake(context, force, extraArgs, configExtraArgs=TBB_CONFIGS)
 
-USD = Dependency("USD", InstallUSD, "include/pxr/pxr.h")
+USD = Dependency("USD", InstallUSD, "include/pxr/pxr.h",
+                 dependsOn=[ZLIB, BOOST, TBB, OPENEXR, OPENIMAGEIO, OPENSUBDIV, MATERIALX],
+                 weight=20,
+                 downloadURL=USD_URL,
+                 fingerprintInputs=[BOOST_NO_SYSTEM_ARGS, TBB_CONFIGS])
 
 ############################################################
 # Slang
@@ -985,33 +2347,46 @@ else:
 
 def InstallSlang(context, force, buildArgs):
     Slang_FOLDER = DownloadURL(Slang_URL, context, force, destDir="Slang")
-    for config in BuildConfigs(context):
-        CopyDirectory(context, Slang_FOLDER, "Slang", config)
+    for config in context.buildConfigs:
+        CopyDirectory(context, Slang_FOLDER, "Slang", config, force, link=True)
 
-SLANG = Dependency("Slang", InstallSlang, "Slang/slang.h")
+SLANG = Dependency("Slang", InstallSlang, "Slang/slang.h",
+                   downloadURL=Slang_URL, downloadArgs=dict(destDir="Slang"))
 
 ############################################################
 # NRD
 
+def CopyNVIDIALibraries(context, name, config, force):
+    """
+    Copies the Release and Debug libraries built by NRD or NRI, as requested
+    by the build variant, to the install directory of the given
+    configuration.
+    """
+    libConfigs = []
+    if context.buildRelease or context.buildRelWithDebInfo:
+        libConfigs.append("Release")
+    if context.buildDebug:
+        libConfigs.append("Debug")
+
+    for libConfig in libConfigs:
+        libDir = "_Build/" + libConfig
+        if Windows():
+            CopyFiles(context, libDir + "/*.dll", "bin", config)
+        CopyDirectory(context, libDir, "{name}/Lib/{libConfig}".format(
+            name=name, libConfig=libConfig), config, force)
+
 NRD_URL = "https://github.com/NVIDIAGameWorks/RayTracingDenoiser.git"
 NRD_TAG = "v3.8.0"
+NRD_FOLDER = "NRD-"+NRD_TAG
 
 def InstallNRD(context, force, buildArgs):
-    NRD_FOLDER = "NRD-"+NRD_TAG
     with CurrentWorkingDirectory(GitClone(NRD_URL, NRD_TAG, NRD_FOLDER, context)):
         RunCMake(context, force, buildArgs, install=False)
 
-        for config in BuildConfigs(context):
-            CopyDirectory(context, "Include", "NRD/Include", config)
-            CopyDirectory(context, "Integration", "NRD/Integration", config)
-            if context.buildRelease or context.buildRelWithDebInfo :
-                if Windows():
-                    CopyFiles(context, "_Build/Release/*.dll", "bin", config)
-                CopyDirectory(context, "_Build/Release", "NRD/Lib/Release", config)
-            if context.buildDebug:
-                if Windows():
-                    CopyFiles(context, "_Build/Debug/*.dll", "bin", config)
-                CopyDirectory(context, "_Build/Debug", "NRD/Lib/Debug", config)
+        for config in context.buildConfigs:
+            CopyDirectory(context, "Include", "NRD/Include", config, force, link=True)
+            CopyDirectory(context, "Integration", "NRD/Integration", config, force, link=True)
+            CopyNVIDIALibraries(context, "NRD", config, force)
 
             # NRD v2.x.x #TODO need to use config as part of installation path
             # CopyDirectory(context, "Shaders", "NRD/Shaders", config)
@@ -1019,37 +2394,34 @@ def InstallNRD(context, force, buildArgs):
             # CopyFiles(context, "External/MathLib/*.*", "NRD/Shaders", config)
             # CopyFiles(context, "Include/*.*", "NRD/Shaders", config)
 
-            # NRD v3.x.x
-            CopyDirectory(context, "Shaders", "NRD/Shaders", config)
-            CopyFiles(context, "Shaders/Include/NRD.hlsli", "NRD/Shaders/Include", config)
+            # NRD v3.x.x (Shaders/Include/NRD.hlsli is installed with the
+            # Shaders directory)
+            CopyDirectory(context, "Shaders", "NRD/Shaders", config, force, link=True)
             CopyFiles(context, "External/MathLib/*.hlsli", "NRD/Shaders/Source", config)
 
-NRD = Dependency("NRD", InstallNRD, "NRD/Include/NRD.h")
+NRD = Dependency("NRD", InstallNRD, "NRD/Include/NRD.h", weight=3,
+                 gitURL=NRD_URL, gitArgs=dict(tag=NRD_TAG, cloneDir=NRD_FOLDER),
+                 fingerprintInputs=[CopyNVIDIALibraries])
 
 ############################################################
 # NRI
 
 NRI_URL = "https://github.com/NVIDIAGameWorks/NRI.git"
 NRI_TAG = "v1.87"
+NRI_FOLDER = "NRI-"+NRI_TAG
 
 def InstallNRI(context, force, buildArgs):
-    NRI_FOLDER = "NRI-"+NRI_TAG
     with CurrentWorkingDirectory(GitClone(NRI_URL, NRI_TAG, NRI_FOLDER, context)):
         RunCMake(context, force, buildArgs, install=False)
 
-        for config in BuildConfigs(context):
-            CopyDirectory(context, "Include", "NRI/Include", config)
-            CopyDirectory(context, "Include/Extensions", "NRI/Include/Extensions", config)
-            if context.buildRelease or context.buildRelWithDebInfo :
-                if Windows():
-                    CopyFiles(context, "_Build/Release/*.dll", "bin", config)
-                CopyDirectory(context, "_Build/Release", "NRI/Lib/Release", config)
-            if context.buildDebug:
-                if Windows():
-                    CopyFiles(context, "_Build/Debug/*.dll", "bin", config)
-                CopyDirectory(context, "_Build/Debug", "NRI/Lib/Debug", config)
+        for config in context.buildConfigs:
+            CopyDirectory(context, "Include", "NRI/Include", config, force, link=True)
+            CopyDirectory(context, "Include/Extensions", "NRI/Include/Extensions", config, force, link=True)
+            CopyNVIDIALibraries(context, "NRI", config, force)
 
-NRI = Dependency("NRI", InstallNRI, "NRI/Include/NRI.h")
+NRI = Dependency("NRI", InstallNRI, "NRI/Include/NRI.h",
+                 gitURL=NRI_URL, gitArgs=dict(tag=NRI_TAG, cloneDir=NRI_FOLDER),
+                 fingerprintInputs=[CopyNVIDIALibraries])
 
 ############################################################
 # GLEW
@@ -1058,8 +2430,8 @@ GLEW_URL = "https://github.com/nigels-com/glew/releases/download/glew-2.2.0/glew
 
 def InstallGLEW(context, force, buildArgs):
     with CurrentWorkingDirectory(DownloadURL(GLEW_URL, context, force)):
-        for config in BuildConfigs(context):
-            CopyDirectory(context, "include/GL", "include/GL", config)
+        for config in context.buildConfigs:
+            CopyDirectory(context, "include/GL", "include/GL", config, force)
             CopyFiles(context, "bin/Release/x64/*.dll", "bin", config)
             CopyFiles(context, "lib/Release/x64/*.lib", "lib", config)
             # TODO: shall we support Debug build of glew?
@@ -1067,7 +2439,8 @@ def InstallGLEW(context, force, buildArgs):
             # CopyFiles(context, f'bin/{buildVariant}/x64/*.dll', "bin")
             # CopyFiles(context, f'lib/{buildVariant}/x64/*.lib', "lib")
 
-GLEW = Dependency("GLEW", InstallGLEW, "include/GL/glew.h")
+GLEW = Dependency("GLEW", InstallGLEW, "include/GL/glew.h",
+                  downloadURL=GLEW_URL)
 
 ############################################################
 # GLFW
@@ -1078,7 +2451,8 @@ def InstallGLFW(context, force, buildArgs):
     with CurrentWorkingDirectory(DownloadURL(GLFW_URL, context, force)):
         RunCMake(context, force, buildArgs)
 
-GLFW = Dependency("GLFW", InstallGLFW, "include/GLFW/glfw3.h")
+GLFW = Dependency("GLFW", InstallGLFW, "include/GLFW/glfw3.h",
+                  downloadURL=GLFW_URL)
 
 ############################################################
 # CXXOPTS
@@ -1089,7 +2463,8 @@ def InstallCXXOPTS(context, force, buildArgs):
     with CurrentWorkingDirectory(DownloadURL(CXXOPTS_URL, context, force)):
         RunCMake(context, force, buildArgs)
 
-CXXOPTS = Dependency("CXXOPTS", InstallCXXOPTS, "include/cxxopts.hpp")
+CXXOPTS = Dependency("CXXOPTS", InstallCXXOPTS, "include/cxxopts.hpp",
+                     downloadURL=CXXOPTS_URL)
 
 ############################################################
 # GTEST
@@ -1101,7 +2476,8 @@ def InstallGTEST(context, force, buildArgs):
         extraArgs = [*buildArgs, '-Dgtest_force_shared_crt=ON']
         RunCMake(context, force, extraArgs)
 
-GTEST = Dependency("GTEST", InstallGTEST, "include/gtest/gtest.h")
+GTEST = Dependency("GTEST", InstallGTEST, "include/gtest/gtest.h",
+                   downloadURL=GTEST_URL)
 
 ############################################################
 # Installation script
@@ -1129,6 +2505,18 @@ library. Multiple quotes may be needed to ensure arguments are passed on
 exactly as desired. Users must ensure these arguments are suitable for the
 specified library and do not conflict with other options, otherwise build
 errors may occur.
+
+- Using Prebuilt Libraries:
+Users may install libraries from prebuilt archives instead of building them
+using the --prebuilt option. The values for this option must take the form
+<library name>,<url>, where {{config}} in the URL is replaced by the build
+configuration (Debug, Release or RelWithDebInfo). Each archive must contain the
+install tree of the library, optionally in a single top-level directory. For
+example:
+
+%(prog)s --prebuilt boost,https://example.com/boost-1.70-{{config}}.tar.gz ...
+
+Libraries forced with --force or --force-all are built from source.
 """.format(
     libraryList=" ".join(sorted([d.name for d in AllDependencies])))
 
@@ -1164,6 +2552,10 @@ group.add_argument("-q", "--quiet", action="store_const", const=0,
                    dest="verbosity",
                    help="Suppress all output except for error messages")
 
+DEFAULT_DOWNLOAD_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".aurora",
+                                          "externals-cache")
+DEFAULT_BUILD_CACHE_SIZE_GB = 20
+
 group = parser.add_argument_group(title="Build Options")
 group.add_argument("--build", type=str,
                    help=("Build directory for external libraries "
@@ -1188,22 +2580,53 @@ if Windows():
 group.add_argument("--build-args", type=str, nargs="*", default=[],
                    help=("Custom arguments to pass to build system when "
                          "building libraries (see docs above)"))
+group.add_argument("--prebuilt", type=str, action="append", dest="prebuilt",
+                   default=[],
+                   help=("Install the specified library from a prebuilt "
+                         "archive (see docs above)"))
 group.add_argument("--force", type=str, action="append", dest="force_build",
                    default=[],
                    help=("Force download and build of specified library "
                          "(see docs above)"))
 group.add_argument("--force-all", action="store_true",
                    help="Force download and build of all libraries")
+group.add_argument("--download-cache", type=str,
+                   default=DEFAULT_DOWNLOAD_CACHE_DIR,
+                   help=("Directory where downloaded archives are cached "
+                         "and reused, even when forcing a build. An empty "
+                         "string disables the cache. (default: {0})"
+                         .format(DEFAULT_DOWNLOAD_CACHE_DIR)))
+group.add_argument("--build-cache", type=str,
+                   help=("Enable the build cache in the given directory, e.g. "
+                         "~/.aurora/build-cache. The files installed by the "
+                         "libraries are cached there, and reused instead of "
+                         "building a library again with the same inputs, "
+                         "toolchain and install directory, unless forcing a "
+                         "build. (default: disabled)"))
+group.add_argument("--build-cache-size", type=float,
+                   default=DEFAULT_BUILD_CACHE_SIZE_GB,
+                   help=("Maximum size of the build cache in GB. The least "
+                         "recently used libraries are removed from the cache "
+                         "when it gets larger. (default: {0})"
+                         .format(DEFAULT_BUILD_CACHE_SIZE_GB)))
 group.add_argument("--generator", type=str,
                    help=("CMake generator to use when building libraries with "
                          "cmake"))
 group.add_argument("--toolset", type=str,
                    help=("CMake toolset to use when building libraries with "
                          "cmake"))
-group.add_argument("-j", "--jobs", type=int, default=GetCPUCount(),
+group.add_argument("--unity-build", action="store_true", default=False,
+                   help=("Use CMake unity builds for OpenImageIO, OpenSubdiv, "
+                         "MaterialX and USD (experimental: the pinned versions "
+                         "of these libraries are not known to build this way)"))
+group.add_argument("-j", "--jobs", type=int, default=GetDefaultJobCount(),
                    help=("Number of build jobs to run in parallel. "
-                         "(default: # of processors [{0}])"
-                         .format(GetCPUCount())))
+                         "(default: $AURORA_BUILD_JOBS or # of processors [{0}])"
+                         .format(GetDefaultJobCount())))
+group.add_argument("--parallel-deps", type=int, default=4,
+                   help=("Maximum number of independent libraries to build "
+                         "at the same time. They share the build jobs, and a "
+                         "library building alone gets all of them. (default: 4)"))
 
 args = parser.parse_args()
 
@@ -1224,18 +2647,69 @@ class InstallContext:
         self.buildDir = (os.path.abspath(args.build) if args.build
                          else os.path.join(self.externalsInstDir, "build"))
 
-        self.downloader = DownloadFileWithUrllib
-        self.downloaderName = "built-in"
+        # Use aria2c if available, as it downloads over several connections.
+        # Otherwise persistent connections are used, except when a proxy is
+        # configured as they don't go through proxies.
+        if which("aria2c"):
+            self.downloader = DownloadFileWithAria2
+            self.downloaderName = "aria2c"
+        elif urllib.request.getproxies():
+            self.downloader = DownloadFileWithUrllib
+            self.downloaderName = "built-in"
+        else:
+            self.downloader = DownloadFileWithHTTPConnection
+            self.downloaderName = "built-in"
+
+        # Archives being downloaded and extracted ahead of time, keyed by URL,
+        # with the DownloadURL arguments used for them
+        self.prefetchedDownloads = dict()
+
+        # Directory where downloaded archives are cached, if any
+        self.downloadCacheDir = (os.path.abspath(args.download_cache)
+                                 if args.download_cache else None)
+
+        # Directory where the install trees of the libraries are cached, if
+        # any
+        self.buildCacheDir = (os.path.abspath(os.path.expanduser(args.build_cache))
+                              if args.build_cache else None)
+        self.buildCacheMaxSize = int(args.build_cache_size * 1024 ** 3)
 
         # CMake generator and toolset
         self.cmakeGenerator = args.generator
         self.cmakeToolset = args.toolset
 
+        # Default to Ninja if available, as it schedules the build jobs faster
+        # than make. This isn't done on Windows, where Ninja needs to run from
+        # a Visual Studio developer command prompt.
+        if (self.cmakeGenerator is None and not Windows() and
+            not os.environ.get("CMAKE_GENERATOR") and which("ninja")):
+            self.cmakeGenerator = "Ninja"
+
+        # Unity builds of the larger libraries
+        self.unityBuild = args.unity_build
+
+        # Compiler cache used as the compiler launcher, if any. A launcher
+        # given with the CMAKE_<LANG>_COMPILER_LAUNCHER environment variables,
+        # which CMake uses by default, takes precedence.
+        if (os.environ.get("CMAKE_C_COMPILER_LAUNCHER") or
+            os.environ.get("CMAKE_CXX_COMPILER_LAUNCHER")):
+            self.compilerLauncher = None
+        else:
+            self.compilerLauncher = which("ccache") or which("sccache")
+
         # Number of jobs
         self.numJobs = args.jobs
         if self.numJobs <= 0:
             raise ValueError("Number of jobs must be greater than 0")
 
+        # Build jobs shared by the builds of all dependencies
+        self.buildJobPool = BuildJobPool(self.numJobs)
+
+        # Number of dependencies installed at the same time
+        self.parallelDeps = args.parallel_deps
+        if self.parallelDeps <= 0:
+            raise ValueError("Number of parallel libraries must be greater than 0")
+
         # Build arguments
         self.buildArgs = dict()
         for a in args.build_args:
@@ -1249,6 +2723,19 @@ class InstallContext:
 
             self.buildArgs.setdefault(depName.lower(), []).append(arg)
 
+        # Prebuilt archives
+        self.prebuiltURLs = dict()
+        for a in args.prebuilt:
+            (depName, _, url) = a.partition(",")
+            if not depName or not url:
+                raise ValueError("Invalid argument for --prebuilt: {}"
+                                 .format(a))
+            if depName.lower() not in AllDependenciesByName:
+                raise ValueError("Invalid library for --prebuilt: {}"
+                                 .format(depName))
+
+            self.prebuiltURLs[depName.lower()] = url
+
         # Build type
         if Linux():
             # There is a cmake bug in the debug build of OpenImageIO on Linux. That bug fails the Aurora
@@ -1262,15 +2749,32 @@ class InstallContext:
             self.buildRelease = (args.build_variant == BUILD_RELEASE) or (args.build_variant == BUILD_DEBUG_AND_RELEASE)
             self.buildRelWithDebInfo  = (args.build_variant == BUILD_RELWITHDEBINFO)
 
+        # Configurations to build and their install directories
+        self.buildConfigs = BuildConfigs(self)
+        self.configInstDirs = {config: os.path.join(self.externalsInstDir, config)
+                               for config in self.buildConfigs}
+
         # Dependencies that are forced to be built
         self.forceBuildAll = args.force_all
         self.forceBuild = [dep.lower() for dep in args.force_build]
 
+        # Installed libraries that changed since they were installed, which
+        # are rebuilt like forced libraries
+        self.staleDependencies = []
+
     def GetBuildArguments(self, dep):
         return self.buildArgs.get(dep.name.lower(), [])
 
+    def GetPrebuiltURL(self, dep):
+        return self.prebuiltURLs.get(dep.name.lower())
+
     def ForceBuildDependency(self, dep):
-        return self.forceBuildAll or dep.name.lower() in self.forceBuild
+        return (self.forceBuildAll or dep.name.lower() in self.forceBuild or
+                dep.name.lower() in self.staleDependencies)
+
+    def UseBuildCache(self, dep):
+        return (self.buildCacheDir and not self.forceBuildAll and
+                dep.name.lower() not in self.forceBuild)
 
 try:
     context = InstallContext(args)
@@ -1325,49 +2829,60 @@ requiredDependencies = [ZLIB,
 # libgtest-dev: 1.10.0
 # libgmock-dev: 1.10.0
 if Linux():
-    excludes = [ZLIB, JPEG, TIFF, PNG, GLM, GLEW, GLFW, GTEST]
-    for lib in excludes:
-        requiredDependencies.remove(lib)
-    print(requiredDependencies)
-
-dependenciesToBuild = []
-for dep in requiredDependencies:
-    if context.ForceBuildDependency(dep) or not dep.Exists(context):
-        if dep not in dependenciesToBuild:
-            dependenciesToBuild.append(dep)
+    excludes = {ZLIB, JPEG, TIFF, PNG, GLM, GLEW, GLFW, GTEST}
+    requiredDependencies = [dep for dep in requiredDependencies
+                            if dep not in excludes]
+
+# Deduplicate while keeping the order of the required dependencies.
+installedListings = dict()
+dependenciesToBuild = [dep for dep in dict.fromkeys(requiredDependencies)
+                       if context.ForceBuildDependency(dep) or
+                          not dep.IsUpToDate(context, installedListings)]
+
+# Rebuild the installed dependencies whose installer, download or build
+# arguments changed since they were installed, instead of reusing their stale
+# sources and build directories.
+for dep in dependenciesToBuild:
+    if (not context.ForceBuildDependency(dep) and
+        dep.Exists(context, installedListings)):
+        PrintInfo("{dep} changed since it was installed, rebuilding it"
+                  .format(dep=dep.name))
+        context.staleDependencies.append(dep.name.lower())
 
 # Verify toolchain needed to build required dependencies
-if (not which("g++") and
-    not which("clang") and
-    not GetVisualStudioCompilerAndVersion()):
-    PrintError("C++ compiler not found -- please install a compiler")
-    sys.exit(1)
-
-if which("cmake"):
-    # Check cmake requirements
-    cmake_required_version = (3, 21)
-    cmake_version = GetCMakeVersion()
-    if not cmake_version:
-        PrintError("Failed to determine CMake version")
+# (only needed if there is anything to build)
+if dependenciesToBuild:
+    if (not which("g++") and
+        not which("clang") and
+        not GetVisualStudioCompilerAndVersion()):
+        PrintError("C++ compiler not found -- please install a compiler")
         sys.exit(1)
 
-    if cmake_version < cmake_required_version:
-        def _JoinVersion(v):
-            return ".".join(str(n) for n in v)
-        PrintError("CMake version {req} or later required to build externals of Aurora,"
-                   "but version found was {found}".format(
-                       req=_JoinVersion(cmake_required_version),
-                       found=_JoinVersion(cmake_version)))
+    if which("cmake"):
+        # Check cmake requirements
+        cmake_required_version = (3, 21)
+        cmake_version = GetCMakeVersion()
+        if not cmake_version:
+            PrintError("Failed to determine CMake version")
+            sys.exit(1)
+
+        if cmake_version < cmake_required_version:
+            def _JoinVersion(v):
+                return ".".join(str(n) for n in v)
+            PrintError("CMake version {req} or later required to build externals of Aurora,"
+                       "but version found was {found}".format(
+                           req=_JoinVersion(cmake_required_version),
+                           found=_JoinVersion(cmake_version)))
+            sys.exit(1)
+    else:
+        PrintError("CMake not found -- please install it and adjust your PATH")
         sys.exit(1)
-else:
-    PrintError("CMake not found -- please install it and adjust your PATH")
-    sys.exit(1)
 
-if JPEG in requiredDependencies:
-    # NASM is required to build libjpeg-turbo on Windows
-    if (Windows() and not which("nasm")):
-        PrintError("nasm not found -- please install it and adjust your PATH")
-        sys.exit(1)
+    if JPEG in requiredDependencies:
+        # NASM is required to build libjpeg-turbo on Windows
+        if (Windows() and not which("nasm")):
+            PrintError("nasm not found -- please install it and adjust your PATH")
+            sys.exit(1)
 
 Print(requiredDependenciesMsg)
 
@@ -1378,8 +2893,13 @@ Building with settings:
     Externals source directory    {externalsSrcDir}
     Externals install directory   {externalsInstDir}
     Build directory               {buildDir}
+    Download cache directory      {downloadCacheDir}
+    Build cache directory         {buildCacheDir}
     CMake generator               {cmakeGenerator}
     CMake toolset                 {cmakeToolset}
+    Downloader                    {downloader}
+    Compiler launcher             {compilerLauncher}
+    Unity builds                  {unityBuild}
 """
 
 summaryMsg += """
@@ -1392,6 +2912,11 @@ if context.buildArgs:
     Build arguments               {buildArgs}
 """
 
+if context.prebuiltURLs:
+    summaryMsg += """
+    Prebuilt libraries            {prebuilt}
+"""
+
 def FormatBuildArguments(buildArgs):
     s = ""
     for depName in sorted(buildArgs.keys()):
@@ -1406,14 +2931,25 @@ summaryMsg = summaryMsg.format(
     auroraSrcDir=context.auroraSrcDir,
     externalsSrcDir=context.externalsSrcDir,
     buildDir=context.buildDir,
+    downloadCacheDir=(context.downloadCacheDir or "Disabled"),
+    buildCacheDir=("{dir} (up to {size:g} GB)".format(
+                       dir=context.buildCacheDir, size=args.build_cache_size)
+                   if context.buildCacheDir else "Disabled"),
+    downloader=context.downloaderName,
     externalsInstDir=context.externalsInstDir,
     cmakeGenerator=("Default" if not context.cmakeGenerator
                     else context.cmakeGenerator),
     cmakeToolset=("Default" if not context.cmakeToolset
                   else context.cmakeToolset),
+    compilerLauncher=(context.compilerLauncher or
+                      os.environ.get("CMAKE_CXX_COMPILER_LAUNCHER") or
+                      os.environ.get("CMAKE_C_COMPILER_LAUNCHER") or "None"),
+    unityBuild=("On" if context.unityBuild else "Off"),
     dependencies=("None" if not dependenciesToBuild else
                   ", ".join([d.name for d in dependenciesToBuild])),
     buildArgs=FormatBuildArguments(context.buildArgs),
+    prebuilt=FormatBuildArguments({depName: [url] for depName, url
+                                   in context.prebuiltURLs.items()}),
     buildVariant=("Debug and Release" if context.buildDebug and context.buildRelease
                   else "Release" if context.buildRelease
                   else "Debug" if context.buildDebug
@@ -1427,27 +2963,28 @@ if args.dry_run:
     sys.exit(0)
 
 # Ensure directory structure is created and is writable.
-for dir in [context.externalsInstDir, context.externalsSrcDir, context.buildDir]:
-    try:
-        if os.path.isdir(dir):
-            testFile = os.path.join(dir, "canwrite")
-            open(testFile, "w").close()
-            os.remove(testFile)
-        else:
-            os.makedirs(dir)
-    except Exception as e:
-        PrintError("Could not write to directory {dir}. Change permissions "
-                   "or choose a different location to install to."
-                   .format(dir=dir))
-        sys.exit(1)
+# (only needed if there is anything to install)
+if dependenciesToBuild:
+    for dir in [context.externalsInstDir, context.externalsSrcDir, context.buildDir]:
+        try:
+            if os.path.isdir(dir):
+                testFile = os.path.join(dir, "canwrite")
+                open(testFile, "w").close()
+                os.remove(testFile)
+            else:
+                os.makedirs(dir)
+        except Exception as e:
+            PrintError("Could not write to directory {dir}. Change permissions "
+                       "or choose a different location to install to."
+                       .format(dir=dir))
+            sys.exit(1)
+
+    # Finish removing the directories of an interrupted run.
+    EmptyTrash(context)
 
 try:
     # Download, build and install external libraries
-    for dep in dependenciesToBuild:
-        PrintStatus("Installing {dep}...".format(dep=dep.name))
-        dep.installer(context,
-                      buildArgs=context.GetBuildArguments(dep),
-                      force=context.ForceBuildDependency(dep))
+    InstallDependencies(context, dependenciesToBuild)
 except Exception as e:
     PrintError(str(e))
     sys.exit(1)
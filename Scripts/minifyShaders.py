@@ -1,3 +1,4 @@
+import concurrent.futures
 import os
 import shutil
 import sys
@@ -6,106 +7,144 @@ import subprocess
 
 # TODO: delete this python script. It seems not used anywehere.
 
-# If first define not provided assume empty string:
-if(len(sys.argv)==3):
-    sys.argv.append("\"\"")
+# Regular expressions used to minify the preprocessed HLSL, compiled once
+# rather than for every output file.
+COMMENT_REGEX = re.compile(r"//.*\n")
+WHITESPACE_REGEX = re.compile(r"[^\S\r\n]+")
 
-# Exit with usage if incorrect number of args.
-if(len(sys.argv)<4 or (len(sys.argv)%2)==1):
-    print("Usage: python minifyHLSL.py inputHLSLFile outputHeader0 defines0 ... outputHeaderN definesN")
-    print("  inputHLSLFile - Filename for input HLSL file")
-    print("  outputHeaderN - Filename for Nth output C++ header file")
-    print("  definesN - Defines to generate Nth output header, in format VARIABLE=VALUE (if defines0 omitted assumes empty string)")
-    sys.exit(-1)
-
-# Get input filename from args.
-inputHLSLFile = sys.argv[1]
-
-# Calculate output file count from number of args.
-outputFileCount = int((len(sys.argv)-2)/2)
-
-# Intro status.
-print("minifyHLSL.py minifying %s to %d header files" % (inputHLSLFile, outputFileCount))
-
-# Get list of output header filenames and defines from args.
-ouputHeaderFiles = []
-dxcDefines = []
-for outputFileIdx in range(0,outputFileCount):
-    ouputHeaderFiles.append(sys.argv[outputFileIdx*2+2])
-    dxcDefines.append(sys.argv[outputFileIdx*2+3])
+# Escapes for the C string: backslashes are doubled (8x required as python AND
+# DXC needed escaping), quotes are escaped and newlines become \n. The actual
+# newline is kept after each escaped one to find the line boundaries later.
+ESCAPE_TABLE = str.maketrans({"\\": "\\\\", "\"": "\\\"", "\n": "\\n\n"})
 
 # String variable prefix used in generated headers.
 # TODO: Could be command line arg.
 stringPrefix = "g_"
 
-# Iterate through output files
-for outputFileIdx in range(0,outputFileCount):
-
+def MinifyVariant(inputHLSLFile, outputHeaderFile, defines):
+    """
+    Preprocesses inputHLSLFile with the given defines and writes the minified
+    result as a C string to outputHeaderFile. Each variant writes to its own
+    preprocessed file, so several can run at the same time.
+    """
     # Calculate temp preprocessed filename from output filename.
-    preprocessedHLSLFile = ouputHeaderFiles[outputFileIdx] + ".preprocessed.hlsl"
+    preprocessedHLSLFile = outputHeaderFile + ".preprocessed.hlsl"
 
     # Work out string variable name from prefix string and filename.
-    baseOutputFile =os.path.splitext(os.path.basename(ouputHeaderFiles[outputFileIdx]))[0];
+    baseOutputFile =os.path.splitext(os.path.basename(outputHeaderFile))[0];
     stringName = stringPrefix+baseOutputFile;
 
     # Run DXC to generate single preprocessed HLSL file (with all includes and ifdefs expanded)
-    dxcCommand = "dxc -D %s %s -P %s" % (dxcDefines[outputFileIdx], inputHLSLFile, preprocessedHLSLFile)
-    print("Preprocessing %s with defines %s to %s" % (inputHLSLFile, dxcDefines[outputFileIdx], preprocessedHLSLFile))
+    dxcCommand = ["dxc", "-D", defines, inputHLSLFile, "-P", preprocessedHLSLFile]
+    print("Preprocessing %s with defines %s to %s" % (inputHLSLFile, defines, preprocessedHLSLFile))
     try:
-        compileRes = subprocess.check_output(dxcCommand, shell=True, stderr=subprocess.STDOUT)
+        compileRes = subprocess.check_output(dxcCommand, stderr=subprocess.STDOUT)
     except:
         # Exit if DXC command fails.
-        print("Failed to run DXC command (is DXC in the path?):\n"+dxcCommand)
+        print("Failed to run DXC command (is DXC in the path?):\n"+" ".join(dxcCommand))
         sys.exit(-1)
 
     # Print DXC output with a warning, if we have some (should not have any.)
     if(len(compileRes)>0):
-        print("WARNING: DXC produced unexpected output:"+dxcCommand)
+        print("WARNING: DXC produced unexpected output:"+" ".join(dxcCommand))
         print(compileRes)
 
-    # Open header output file (exit if open fails.)
+    # Read the whole pre-processed HLSL file (exit if open fails.)
+    print("Minifying to %s" % (outputHeaderFile))
     try:
-        headerOutput = open(ouputHeaderFiles[outputFileIdx] , "w")
+        with open(preprocessedHLSLFile, "r") as preprocFile:
+            source = preprocFile.read()
     except:
-        print("Failed to open:"+ouputHeaderFiles[outputFileIdx])
+        print("Failed to open:"+preprocessedHLSLFile)
         sys.exit(-1)
 
-    # Open pre-processed HLSL file (exit if open fails.)
-    print("Minifying to %s" % (ouputHeaderFiles[outputFileIdx]))
+    # Remove single line comments (TODO: Remove multi-line comments)
+    source = COMMENT_REGEX.sub("\n", source)
+    # Escape backslashes, quotes and newlines in C source.
+    source = source.translate(ESCAPE_TABLE)
+    # Remove extra non-newline whitespace.
+    source = WHITESPACE_REGEX.sub(" ", source)
+
+    # Begin C string in minified header.
+    headerLines = ['const std::string '+stringName+' = ']
+
+    # Current header file output line, as a list of escaped HLSL lines.
+    currOutput = []
+    currOutputLength = 0
+
+    # Iterate through all the lines. They are never split, so escape
+    # sequences stay within one quoted string.
+    for ln in source.split("\n"):
+        currOutput.append(ln)
+        currOutputLength += len(ln)
+
+        # When current line longer than 100 chars, write to header string (wrapping in quotes and adding newline+backslash)
+        if(currOutputLength>100):
+            headerLines.append('\t\"'+"".join(currOutput)+'\" \\\n')
+            currOutput = []
+            currOutputLength = 0
+
+    # Finish header file.
+    headerLines.append('\t\"'+"".join(currOutput)+'\"')
+    headerLines.append(';\n')
+    header = "".join(headerLines)
+
+    # Leave the header untouched if it's already up to date, so that the
+    # sources including it are not rebuilt. DXC still has to run every time,
+    # since any of the files included by the HLSL file may have changed.
     try:
-        preprocFile = open(preprocessedHLSLFile, "r")
+        with open(outputHeaderFile, "r") as headerInput:
+            if headerInput.read() == header:
+                print("%s is up to date" % (outputHeaderFile))
+                return
+    except OSError:
+        pass
+
+    # Write header output file (exit if open fails.)
+    try:
+        headerOutput = open(outputHeaderFile , "w")
     except:
-        print("Failed to open:"+ouputHeaderFile)
+        print("Failed to open:"+outputHeaderFile)
         sys.exit(-1)
 
-    # Begin C string in minified header.
-    headerOutput.write('const std::string '+stringName+' = ')
-
-    # Current header file output line.
-    currOutputStr = ""
-
-    # Iterate through all the lines.
-    for ln in preprocFile.readlines():
-        # Remove single line comments (TODO: Remove multi-line comments)
-        ln = re.sub(r"//.*\n", "\n", ln)
-        # Replace single backslash with double backslash in C source (8x required as python AND DXC needed escaping).
-        ln = re.sub(r"\\", "\\\\\\\\", ln)
-        # Escape newlines
-        ln = re.sub(r"\n", "\\\\n", ln)
-        # Remove extra non-newline whitespace.
-        ln = re.sub(r"[^\S\r\n]+", " ", ln)
-        # Escape quotes.
-        ln = re.sub(r"\"", "\\\"", ln)
-
-        # Append to current line in header file string.
-        currOutputStr += ln
+    with headerOutput:
+        headerOutput.write(header)
 
-        # When current line longer than 100 chars, write to header string (wrapping in quotes and adding newline+backslash)
-        if(len(currOutputStr)>100):
-            headerOutput.write('\t\"'+currOutputStr+'\" \\\n')
-            currOutputStr=""
-
-    # Finish writing header file.
-    headerOutput.write('\t\"'+currOutputStr+'\"')
-    headerOutput.write(';\n')
-    headerOutput.close()
+if __name__ == "__main__":
+    # If first define not provided assume empty string:
+    if(len(sys.argv)==3):
+        sys.argv.append("")
+
+    # Exit with usage if incorrect number of args.
+    if(len(sys.argv)<4 or (len(sys.argv)%2)==1):
+        print("Usage: python minifyHLSL.py inputHLSLFile outputHeader0 defines0 ... outputHeaderN definesN")
+        print("  inputHLSLFile - Filename for input HLSL file")
+        print("  outputHeaderN - Filename for Nth output C++ header file")
+        print("  definesN - Defines to generate Nth output header, in format VARIABLE=VALUE (if defines0 omitted assumes empty string)")
+        sys.exit(-1)
+
+    # Get input filename from args.
+    inputHLSLFile = sys.argv[1]
+
+    # Calculate output file count from number of args.
+    outputFileCount = int((len(sys.argv)-2)/2)
+
+    # Intro status.
+    print("minifyHLSL.py minifying %s to %d header files" % (inputHLSLFile, outputFileCount))
+
+    # Get list of output header filenames and defines from args.
+    ouputHeaderFiles = []
+    dxcDefines = []
+    for outputFileIdx in range(0,outputFileCount):
+        ouputHeaderFiles.append(sys.argv[outputFileIdx*2+2])
+        dxcDefines.append(sys.argv[outputFileIdx*2+3])
+
+    # Preprocess and minify the variants in parallel, they are independent of
+    # each other.
+    workers = min(outputFileCount, os.cpu_count() or 1)
+    if workers > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(MinifyVariant, [inputHLSLFile]*outputFileCount, ouputHeaderFiles, dxcDefines))
+    else:
+        for outputFileIdx in range(0,outputFileCount):
+            MinifyVariant(inputHLSLFile, ouputHeaderFiles[outputFileIdx], dxcDefines[outputFileIdx])
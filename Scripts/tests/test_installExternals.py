@@ -0,0 +1,404 @@
+# Copyright 2023 Autodesk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Tests for the helpers of installExternals.py. Run with:
+#   python -m unittest discover -s Scripts/tests
+#
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import types
+import unittest
+import unittest.mock
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      "installExternals.py")
+
+def LoadInstallExternals():
+    """
+    Returns the globals of installExternals.py. The script runs everything at
+    the top level, so it is executed with --help, which exits once all the
+    helpers are defined.
+    """
+    scriptGlobals = {"__name__": "installExternals", "__file__": SCRIPT}
+    argv = sys.argv
+    sys.argv = [SCRIPT, "--help"]
+    try:
+        with open(SCRIPT, "r") as f, contextlib.redirect_stdout(io.StringIO()):
+            exec(compile(f.read(), SCRIPT, "exec"), scriptGlobals)
+    except SystemExit:
+        pass
+    finally:
+        sys.argv = argv
+    return scriptGlobals
+
+installExternals = LoadInstallExternals()
+
+class CopyFileTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.src = os.path.join(self.dir, "src.hlsli")
+        self.dst = os.path.join(self.dir, "dst.hlsli")
+        with open(self.src, "w") as f:
+            f.write("source contents")
+
+    def testCopyOntoHardLink(self):
+        # Copying onto a hard link to the source must not truncate the source.
+        installExternals["LinkOrCopyFile"](self.src, self.dst)
+        installExternals["CloneOrCopyFile"](self.src, self.dst)
+        for path in (self.src, self.dst):
+            with open(path, "r") as f:
+                self.assertEqual(f.read(), "source contents")
+
+    def testCopyOntoHardLinkToOtherFile(self):
+        other = os.path.join(self.dir, "other.hlsli")
+        with open(other, "w") as f:
+            f.write("other contents")
+        installExternals["LinkOrCopyFile"](other, self.dst)
+        installExternals["CloneOrCopyFile"](self.src, self.dst)
+        with open(other, "r") as f:
+            self.assertEqual(f.read(), "other contents")
+        with open(self.dst, "r") as f:
+            self.assertEqual(f.read(), "source contents")
+
+    def testCopyOntoItself(self):
+        with self.assertRaises(shutil.SameFileError):
+            installExternals["CloneOrCopyFile"](self.src, self.src)
+        with open(self.src, "r") as f:
+            self.assertEqual(f.read(), "source contents")
+
+def JoinThreads():
+    for thread in threading.enumerate():
+        if thread is not threading.current_thread():
+            thread.join()
+
+class RemoveDirectoryTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.context = types.SimpleNamespace(buildDir=os.path.join(self.dir, "build"))
+        self.instDir = os.path.join(self.dir, "Release")
+        os.makedirs(os.path.join(self.instDir, "include", "tbb"))
+
+    def testRemoveDirectory(self):
+        installExternals["RemoveDirectory"](
+            self.context, os.path.join(self.instDir, "include", "tbb"))
+        # Nothing is left in the install directory, even before the directory
+        # is deleted.
+        self.assertEqual(os.listdir(os.path.join(self.instDir, "include")), [])
+        JoinThreads()
+        self.assertEqual(os.listdir(os.path.join(self.context.buildDir, ".trash")), [])
+
+    def testEmptyTrash(self):
+        leftover = os.path.join(self.context.buildDir, ".trash", "leftover")
+        os.makedirs(os.path.join(leftover, "include"))
+        installExternals["EmptyTrash"](self.context)
+        JoinThreads()
+        self.assertFalse(os.path.exists(leftover))
+
+class BuildJobPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = installExternals["BuildJobPool"](8)
+
+    def testAloneGetsAllJobs(self):
+        with self.pool.Acquire() as numJobs:
+            self.assertEqual(numJobs, 8)
+        with self.pool.Acquire(2) as numJobs:
+            self.assertEqual(numJobs, 2)
+        # The jobs were given back.
+        with self.pool.Acquire() as numJobs:
+            self.assertEqual(numJobs, 8)
+
+    def testConcurrentBuildsShareJobs(self):
+        with self.pool.Acquire(6) as first:
+            # The second build gets half of the jobs, or what the first one
+            # left.
+            with self.pool.Acquire() as second:
+                self.assertEqual((first, second), (6, 2))
+            with self.pool.Acquire(1) as third:
+                self.assertEqual(third, 1)
+
+    def testWaitForJobs(self):
+        jobs = []
+        def Build():
+            with self.pool.Acquire() as numJobs:
+                jobs.append(numJobs)
+
+        thread = threading.Thread(target=Build)
+        with self.pool.Acquire():
+            # No jobs are left, so the build waits until the first one is
+            # done, then gets all the jobs since it builds alone.
+            thread.start()
+            thread.join(0.1)
+            self.assertEqual(jobs, [])
+        thread.join()
+        self.assertEqual(jobs, [8])
+
+class FakeResponse(io.BytesIO):
+    def __init__(self, data, length):
+        super().__init__(data)
+        self.headers = {"Content-Length": str(length)}
+
+class WriteResponseToFileTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, "archive.zip")
+
+    def testComplete(self):
+        installExternals["WriteResponseToFile"](FakeResponse(b"0123456789", 10), self.path)
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), b"0123456789")
+
+    def testTruncated(self):
+        with self.assertRaises(RuntimeError):
+            installExternals["WriteResponseToFile"](FakeResponse(b"01234", 10), self.path)
+
+class DownloadCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.context = types.SimpleNamespace(
+            externalsSrcDir=os.path.join(self.dir, "src"),
+            downloadCacheDir=os.path.join(self.dir, "cache"),
+            downloader=None)
+        os.makedirs(self.context.externalsSrcDir)
+        os.makedirs(self.context.downloadCacheDir)
+
+    def testBadCachedArchiveIsRemoved(self):
+        url = "https://example.com/archive.zip"
+        cachePath = installExternals["GetDownloadCachePath"](self.context, url)
+        with open(cachePath, "wb") as f:
+            f.write(b"not an archive")
+
+        with self.assertRaises(RuntimeError):
+            installExternals["DownloadAndExtractURL"](url, self.context, False)
+        self.assertFalse(os.path.exists(cachePath))
+        self.assertTrue(os.path.exists(
+            os.path.join(self.context.externalsSrcDir, "archive.zip.bad")))
+
+class FakeContext(object):
+    """
+    The parts of InstallContext used to install dependencies, which can't be
+    created without running the script.
+    """
+    def __init__(self, instDir, configs=("Release",)):
+        self.buildConfigs = list(configs)
+        self.configInstDirs = {config: os.path.join(instDir, config)
+                               for config in configs}
+        self.buildCacheDir = None
+        self.buildArgs = dict()
+        self.prebuiltURLs = dict()
+        self.forceBuildAll = False
+        self.forceBuild = []
+        self.staleDependencies = []
+        self.unityBuild = False
+        self.cmakeGenerator = None
+        self.cmakeToolset = None
+        self.numJobs = 4
+        self.parallelDeps = 1
+        self.prefetchedDownloads = dict()
+
+    def GetBuildArguments(self, dep):
+        return self.buildArgs.get(dep.name.lower(), [])
+
+    def GetPrebuiltURL(self, dep):
+        return self.prebuiltURLs.get(dep.name.lower())
+
+    def ForceBuildDependency(self, dep):
+        return (self.forceBuildAll or dep.name.lower() in self.forceBuild or
+                dep.name.lower() in self.staleDependencies)
+
+    def UseBuildCache(self, dep):
+        return (self.buildCacheDir and not self.forceBuildAll and
+                dep.name.lower() not in self.forceBuild)
+
+def InstallNothing(context, force, buildArgs):
+    pass
+
+class SchedulingTest(unittest.TestCase):
+    def setUp(self):
+        Dependency = installExternals["Dependency"]
+        self.leaf = Dependency("TestLeaf", InstallNothing, weight=5)
+        self.base = Dependency("TestBase", InstallNothing, weight=1)
+        self.top = Dependency("TestTop", InstallNothing, dependsOn=[self.base], weight=10)
+
+    def testPriorities(self):
+        priorities = installExternals["GetDependencyPriorities"](
+            [self.leaf, self.top, self.base])
+        self.assertEqual(priorities, {self.leaf: 5, self.top: 10, self.base: 11})
+
+    def testCriticalPathFirst(self):
+        # With a single worker, the light dependency at the start of the
+        # longest chain is installed first, and the chain before the leaf.
+        installed = []
+        context = FakeContext(tempfile.gettempdir())
+        with unittest.mock.patch.dict(installExternals, {
+                "InstallDependency": lambda context, dep, *args: installed.append(dep)}):
+            installExternals["InstallDependencies"](context, [self.leaf, self.top, self.base])
+        self.assertEqual(installed, [self.base, self.top, self.leaf])
+
+class FingerprintTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.context = FakeContext(self.dir, configs=("Debug", "Release"))
+        for instDir in self.context.configInstDirs.values():
+            os.makedirs(os.path.join(instDir, "include"))
+            with open(os.path.join(instDir, "include", "test.h"), "w") as f:
+                f.write("")
+
+        self.compilerIds = []
+        def GetCompilerId():
+            self.compilerIds.append("c++ 1.0")
+            return "c++ 1.0"
+        patcher = unittest.mock.patch.dict(installExternals, {"GetCompilerId": GetCompilerId})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.settings = ["-DOPTION=ON"]
+        self.dep = installExternals["Dependency"](
+            "TestFingerprint", InstallNothing, "include/test.h",
+            downloadURL="https://example.com/test-1.0.zip",
+            fingerprintInputs=[self.settings])
+
+    def testNoRecordedFingerprintIsUpToDate(self):
+        # Dependencies installed before fingerprints were recorded are kept,
+        # without identifying the compiler.
+        self.assertTrue(self.dep.IsUpToDate(self.context))
+        self.assertEqual(self.compilerIds, [])
+
+    def testMissingFilesAreNotUpToDate(self):
+        self.dep.UpdateFingerprint(self.context)
+        os.remove(os.path.join(self.context.configInstDirs["Debug"], "include", "test.h"))
+        self.assertFalse(self.dep.IsUpToDate(self.context))
+
+    def testSameInputsAreUpToDate(self):
+        self.dep.UpdateFingerprint(self.context)
+        self.assertTrue(self.dep.IsUpToDate(self.context))
+
+    def testChangedBuildArgumentsAreStale(self):
+        self.dep.UpdateFingerprint(self.context)
+        self.context.buildArgs["testfingerprint"] = ["-DOTHER=ON"]
+        self.assertFalse(self.dep.IsUpToDate(self.context))
+
+    def testChangedFingerprintInputIsStale(self):
+        self.dep.UpdateFingerprint(self.context)
+        self.settings.append("-DANOTHER=ON")
+        self.assertFalse(self.dep.IsUpToDate(self.context))
+
+    def testChangedDownloadURLIsStale(self):
+        self.dep.UpdateFingerprint(self.context)
+        self.dep.downloadURL = "https://example.com/test-2.0.zip"
+        self.assertFalse(self.dep.IsUpToDate(self.context))
+
+    def testChangedBuildOptionIsStale(self):
+        self.dep.UpdateFingerprint(self.context)
+        self.context.unityBuild = True
+        self.assertFalse(self.dep.IsUpToDate(self.context))
+
+class BuildCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.context = FakeContext(os.path.join(self.dir, "inst"))
+        self.context.buildCacheDir = os.path.join(self.dir, "cache")
+        self.context.buildCacheMaxSize = 1024 ** 3
+        patcher = unittest.mock.patch.dict(installExternals, {
+            "GetCompilerId": lambda: "c++ 1.0",
+            "GetCMakeVersion": lambda: (3, 26)})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        Dependency = installExternals["Dependency"]
+        self.base = Dependency("TestCacheBase", InstallNothing,
+                               downloadURL="https://example.com/base-1.0.zip")
+        self.dep = Dependency("TestCache", InstallNothing, dependsOn=[self.base])
+
+    def Install(self, name, contents):
+        path = os.path.join(self.context.configInstDirs["Release"], "include", name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(contents)
+        return path
+
+    def testDisabled(self):
+        self.context.buildCacheDir = None
+        self.assertIsNone(installExternals["GetBuildCachePath"](self.context, self.dep, "Release"))
+
+    def testPathDependsOnDependencies(self):
+        GetBuildCachePath = installExternals["GetBuildCachePath"]
+        path = GetBuildCachePath(self.context, self.dep, "Release")
+        self.assertEqual(path, GetBuildCachePath(self.context, self.dep, "Release"))
+        self.base.downloadURL = "https://example.com/base-2.0.zip"
+        self.assertNotEqual(path, GetBuildCachePath(self.context, self.dep, "Release"))
+
+    def testStoreAndRestore(self):
+        installedFile = self.Install("test.h", "installed")
+        self.assertFalse(installExternals["RestoreFromBuildCache"](self.context, self.dep))
+        installExternals["StoreInBuildCache"](self.context, self.dep, {installedFile})
+
+        os.remove(installedFile)
+        self.assertTrue(installExternals["RestoreFromBuildCache"](self.context, self.dep))
+        with open(installedFile, "r") as f:
+            self.assertEqual(f.read(), "installed")
+
+    def testTrimRemovesLeastRecentlyUsed(self):
+        GetBuildCachePath = installExternals["GetBuildCachePath"]
+        installedFile = self.Install("test.h", "x" * 1000)
+        for dep in (self.base, self.dep):
+            installExternals["StoreInBuildCache"](self.context, dep, {installedFile})
+        oldPath = GetBuildCachePath(self.context, self.base, "Release")
+        newPath = GetBuildCachePath(self.context, self.dep, "Release")
+        os.utime(oldPath, (0, 0))
+
+        self.context.buildCacheMaxSize = 1500
+        installExternals["TrimBuildCache"](self.context)
+        self.assertFalse(os.path.exists(oldPath))
+        self.assertTrue(os.path.exists(newPath))
+
+class PatchFileTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, "CMakeLists.txt")
+
+    def Patch(self, contents, patches):
+        with open(self.path, "wb") as f:
+            f.write(contents)
+        installExternals["PatchFile"](self.path, patches, multiLineMatches=True)
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def testMultiLineCRLF(self):
+        patched = self.Patch(b"first\r\nold a\r\nold b\r\nlast\r\n",
+                             [("old a\nold b", "new a\nnew b\nnew c")])
+        self.assertEqual(patched, b"first\r\nnew a\r\nnew b\r\nnew c\r\nlast\r\n")
+
+    def testSingleLineCRLF(self):
+        patched = self.Patch(b"first\r\nold\r\nlast\r\n", [("old", "new a\nnew b")])
+        self.assertEqual(patched, b"first\r\nnew a\r\nnew b\r\nlast\r\n")
+
+    def testMultiLineLF(self):
+        patched = self.Patch(b"first\nold a\nold b\nlast\n",
+                             [("old a\nold b", "new a\nnew b")])
+        self.assertEqual(patched, b"first\nnew a\nnew b\nlast\n")
+
+if __name__ == "__main__":
+    unittest.main()